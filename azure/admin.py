@@ -0,0 +1,42 @@
+import logging
+logger = logging.getLogger(__name__)
+
+from datetime import datetime
+
+from flask import request
+from flask_restful import Resource, abort
+
+from azure.app import api
+from azure.clock import clock
+from azure.timers import scheduler
+
+# control the clock of the fake environment, e.g. from integration tests:
+#
+#   GET  /admin/clock                 : mode and current time
+#   POST /admin/clock?advance=3600    : advance a virtual clock by seconds
+#   POST /admin/clock?to=next         : advance it to the next timer
+#   POST /admin/clock?until=<ISO8601> : advance it to a given time, firing all
+#                                       timers on the way
+
+class Clock(Resource):
+  def get(self):
+    return { "mode" : clock.mode, "now" : clock.now().isoformat() }
+
+  def post(self):
+    if not clock.virtual:
+      abort(400, message="the real clock can't be changed, use AZURE_CLOCK=virtual")
+    try:
+      if "advance" in request.args:
+        clock.advance(float(request.args["advance"]))
+      elif request.args.get("to") == "next":
+        scheduler.fast_forward()
+      elif "until" in request.args:
+        scheduler.run_until(datetime.fromisoformat(request.args["until"]))
+      else:
+        abort(400, message="use advance=seconds, to=next or until=time")
+    except ValueError as e:
+      abort(400, message=str(e))
+    return self.get()
+
+api.add_resource( Clock, "/admin/clock" )
+logger.debug("🕰  Clock control endpoint ready @ /admin/clock")
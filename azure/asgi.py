@@ -0,0 +1,220 @@
+# ASGI entry point, next to the WSGI azure.app:server
+#
+#   % uvicorn azure.asgi:server --port 5000
+#   % hypercorn azure.asgi:server --bind 0.0.0.0:5000
+#
+# async HTTP triggered functions run right on the event loop of the server.
+# everything else, sync functions, the app service and the fake OAuth and
+# admin endpoints, is served by the WSGI application on a pool of
+# AZURE_ASGI_THREADS threads (default 40). a slow function only takes a
+# thread, or nothing at all when it's async, instead of a whole worker.
+# streamed response bodies are sent chunk by chunk, files with the zero-copy
+# send extension when the server has it.
+# websockets aren't supported.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import io
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from azure import app
+from azure import responses
+
+def environ(scope, body):
+  # a WSGI environ for an ASGI HTTP request
+  server = scope.get("server") or ("localhost", 80)
+  environ = {
+    "REQUEST_METHOD"    : scope["method"],
+    "SCRIPT_NAME"       : scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+    "PATH_INFO"         : scope["path"].encode("utf-8").decode("latin-1"),
+    "QUERY_STRING"      : scope.get("query_string", b"").decode("latin-1"),
+    "SERVER_NAME"       : server[0],
+    "SERVER_PORT"       : str(server[1]),
+    "SERVER_PROTOCOL"   : f"HTTP/{scope.get('http_version', '1.1')}",
+    "wsgi.version"      : (1, 0),
+    "wsgi.url_scheme"   : scope.get("scheme", "http"),
+    "wsgi.input"        : io.BytesIO(body),
+    "wsgi.errors"       : sys.stderr,
+    "wsgi.multithread"  : True,
+    "wsgi.multiprocess" : True,
+    "wsgi.run_once"     : False,
+    "wsgi.file_wrapper" : FileWrapper
+  }
+  if scope.get("client"):
+    environ["REMOTE_ADDR"] = scope["client"][0]
+  for name, value in scope.get("headers", []):
+    name  = name.decode("latin-1").upper().replace("-", "_")
+    value = value.decode("latin-1")
+    if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+      environ[name] = value
+      continue
+    name = f"HTTP_{name}"
+    environ[name] = f"{environ[name]},{value}" if name in environ else value
+  return environ
+
+class FileWrapper(object):
+  # wsgi.file_wrapper, files are sent with the zero-copy send extension of
+  # ASGI, when the server has it
+  def __init__(self, file, block_size=8192):
+    self.file       = file
+    self.block_size = block_size
+
+  def __iter__(self):
+    return iter(lambda: self.file.read(self.block_size), b"")
+
+  def close(self):
+    self.file.close()
+
+def call(application, environ):
+  # run a WSGI application, returns its status, headers and body: bytes, or
+  # an iterable still to be sent when it's a file, a streamed response body
+  # or larger than a chunk
+  response = {}
+  chunks   = []
+  def start_response(status, headers, exc_info=None):
+    response["status"]  = int(status.split(" ", 1)[0])
+    response["headers"] = headers
+    return chunks.append
+  result = application(environ, start_response)
+  if isinstance(result, (FileWrapper, responses.Body)):
+    return response["status"], response["headers"], result
+  size     = 0
+  iterator = iter(result)
+  try:
+    for chunk in iterator: # the application may start the response here
+      chunks.append(chunk)
+      size += len(chunk)
+      if size > responses.CHUNK_SIZE:
+        rest = Rest(chunks, iterator, result)
+        result = None
+        return response["status"], response["headers"], rest
+  finally:
+    if result is not None and hasattr(result, "close"):
+      result.close()
+  return response["status"], response["headers"], b"".join(chunks)
+
+class Rest(object):
+  # the chunks of a WSGI response that were read, and the rest of them
+  def __init__(self, chunks, iterator, result):
+    self.chunks   = chunks
+    self.iterator = iterator
+    self.result   = result
+
+  def __iter__(self):
+    yield from self.chunks
+    yield from self.iterator
+
+  def close(self):
+    if hasattr(self.result, "close"):
+      self.result.close()
+
+class AsgiServer(object):
+  def __init__(self, application, dispatcher=None):
+    self.application = application # WSGI
+    self.dispatcher  = dispatcher   # of the functions, if any
+    self.executor    = ThreadPoolExecutor(
+      max_workers        = int(os.environ.get("AZURE_ASGI_THREADS", 40)),
+      thread_name_prefix = "asgi"
+    )
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] == "lifespan":
+      return await self.lifespan(receive, send)
+    if scope["type"] != "http":
+      logger.warn(f"⚠️ Unsupported ASGI connection: {scope['type']}")
+      if scope["type"] == "websocket":
+        await send({ "type" : "websocket.close" })
+      return
+
+    body = b""
+    while True:
+      message = await receive()
+      body += message.get("body", b"")
+      if not message.get("more_body"):
+        break
+    request = environ(scope, body)
+
+    found = self.dispatcher and self.dispatcher.match(request)
+    if found and found[0] and found[0].is_async:
+      function, params, _ = found
+      status, headers, body = await self.invoke(function, request, params)
+    else:
+      status, headers, body = await asyncio.get_running_loop().run_in_executor(
+        self.executor, call, self.application, request
+      )
+
+    await send({
+      "type"    : "http.response.start",
+      "status"  : status,
+      "headers" : [ (k.lower().encode("latin-1"), str(v).encode("latin-1")) for k, v in headers ]
+    })
+    if isinstance(body, bytes):
+      await send({
+        "type" : "http.response.body",
+        "body" : b"" if scope["method"] == "HEAD" else body
+      })
+    else:
+      await self.stream(scope, send, body, headers)
+
+  async def stream(self, scope, send, body, headers):
+    loop = asyncio.get_running_loop()
+    try:
+      if scope["method"] == "HEAD":
+        pass
+      elif isinstance(body, FileWrapper) and "http.response.zerocopysend" in scope.get("extensions", {}):
+        length = [ int(v) for k, v in headers if k.lower() == "content-length" ]
+        await send({
+          "type"   : "http.response.zerocopysend",
+          "file"   : body.file,
+          "offset" : body.file.tell(),
+          **({ "count" : length[0] } if length else {})
+        })
+        return
+      elif hasattr(body, "achunks"): # async, iterated right here
+        async for chunk in body.achunks():
+          await send({ "type" : "http.response.body", "body" : chunk, "more_body" : True })
+      else: # chunks are read on the pool
+        chunks = iter(body)
+        while True:
+          chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+          if chunk is None:
+            break
+          if chunk:
+            await send({ "type" : "http.response.body", "body" : bytes(chunk), "more_body" : True })
+      await send({ "type" : "http.response.body", "body" : b"" })
+    finally:
+      if hasattr(body, "aclose"):
+        await body.aclose()
+      elif hasattr(body, "close"):
+        await loop.run_in_executor(self.executor, body.close)
+
+  async def invoke(self, function, request, params):
+    # async functions run on this loop, without taking a thread
+    from azure.func_app import respond
+    cached, miss = function.cache.lookup(request, params) if function.cache else (None, None)
+    if cached:
+      return self.dispatcher.finish(*cached, request)
+    try:
+      result = await function.run(self.dispatcher.request(request, params))
+      status, headers, body = respond(result)
+    except Exception as e:
+      return self.dispatcher.failed(function, e)
+    if miss:
+      status, headers, body = function.cache.store(miss, request, status, headers, body)
+    return self.dispatcher.finish(status, headers, body, request)
+
+  async def lifespan(self, receive, send):
+    while True:
+      message = await receive()
+      if message["type"] == "lifespan.startup":
+        await send({ "type" : "lifespan.startup.complete" })
+      elif message["type"] == "lifespan.shutdown":
+        self.executor.shutdown(wait=False)
+        await send({ "type" : "lifespan.shutdown.complete" })
+        return
+
+server = AsgiServer(app.server, app.mocked_azure.dispatcher)
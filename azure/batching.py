@@ -0,0 +1,82 @@
+# micro-batching of the storage writes of HTTP triggered functions
+#
+# functions handling many small writing requests can have the storage writes
+# of concurrent requests committed together, in function.local.json:
+#
+#   "batch" : {
+#     "window"      : 0.005, seconds to wait for other requests to finish
+#     "maxRequests" : 64     requests committed together at most
+#   }
+#
+# each request still runs on its own and can read its own writes right away.
+# when it finishes, its writes join the group of the requests of the function
+# running at the same time. the first request of a group waits for the others
+# to finish, at most window seconds, then commits everything at once: the
+# SQLite backend transaction, the shared changes and the service bus messages
+# of blob events and output bindings. every request only responds once its
+# writes are committed. tags are journaled in groups anyway.
+
+import logging
+logger = logging.getLogger(__name__)
+
+from threading import Condition, Event
+
+from azure.storage.blob import StorageAccount
+
+class Batch(object):
+  def __init__(self):
+    self.deferred = []
+    self.requests = 0
+    self.done     = Event()
+    self.error    = None
+
+class Batcher(object):
+  def __init__(self, name, config):
+    self.name         = name
+    self.window       = float(config.get("window", .005))
+    self.max_requests = int(config.get("maxRequests", 64))
+    self.changed      = Condition()
+    self.running      = 0    # requests that haven't joined a batch yet
+    self.batch        = None # the one requests join
+
+  def run(self, function, trigger):
+    # invoke a function, collecting its writes, and commit them in a batch
+    with self.changed:
+      self.running += 1
+    StorageAccount.collect()
+    try:
+      return function(trigger)
+    finally:
+      self.commit(StorageAccount.collected())
+
+  def commit(self, deferred):
+    with self.changed:
+      self.running -= 1
+      self.changed.notify_all()
+      if not deferred:
+        return
+      batch = self.batch
+      leader = batch is None
+      if leader:
+        batch = self.batch = Batch()
+      batch.deferred.extend(deferred)
+      batch.requests += 1
+      if batch.requests >= self.max_requests:
+        self.batch = None # full, later requests start another one
+      if leader:
+        self.changed.wait_for(
+          lambda: self.running == 0 or batch.requests >= self.max_requests, self.window
+        )
+        if self.batch is batch:
+          self.batch = None
+    if not leader:
+      batch.done.wait()
+    else:
+      logger.debug(f"📦 Committing the writes of {batch.requests} requests to {self.name}")
+      try:
+        StorageAccount.commit(batch.deferred)
+      except Exception as e:
+        batch.error = e
+      batch.done.set()
+    if batch.error:
+      raise batch.error
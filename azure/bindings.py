@@ -0,0 +1,216 @@
+# bindings: passing the bindings of a function.json to the main function
+#
+# every binding is passed as the parameter with the same name, or else the
+# same name ignoring case. a trigger without a matching parameter is passed as
+# the first unbound parameter and a parameter named context gets the
+# invocation context. besides the triggers, supported bindings are:
+#
+# - blob in        : a func.InputStream, only read when the function reads it,
+#                    or the content, with "dataType" : "binary" or "string".
+#                    None when the blob doesn't exist.
+# - blob out       : a func.Out, its value is uploaded when the function returns
+# - serviceBus out : a func.Out, its value is sent to queueName when the
+#                    function returns, a list sends a message per item
+# - http out       : a func.Out holding the response of an HTTP trigger
+#
+# an output binding named $return gets the return value of the function.
+# paths and queue names can refer to app settings (%SETTING%), {rand-guid},
+# {DateTime} and the data of the trigger: route parameters and query
+# parameters ({query.name}) of HTTP requests and the properties of JSON
+# service bus messages. all of this is worked out once, when the function is
+# loaded, into a plan that is followed on every invocation.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import re
+import json
+import uuid
+
+import azure.functions as func
+from azure.storage.blob import StorageAccount
+from azure.clock import clock
+
+EXPRESSION = re.compile(r"\{([^{}]+)\}")
+BUILTINS   = { "rand-guid", "datetime" }
+
+def substitute(value):
+  # replace app settings, referenced as %SETTING% or plain SETTING
+  for k, v in os.environ.items():
+    value = value.replace(f"%{k}%", v)
+  for k, v in os.environ.items():
+    value = value.replace(k, v)
+  return value
+
+class Template(object):
+  # a path or name with binding expressions, app settings are replaced once
+  def __init__(self, text):
+    self.text        = substitute(text)
+    self.expressions = set(EXPRESSION.findall(self.text))
+    # expressions that need the data of the trigger
+    self.dynamic     = any(not e.lower() in BUILTINS for e in self.expressions)
+
+  def format(self, data):
+    if not self.expressions:
+      return self.text
+    def value(match):
+      name = match.group(1).lower()
+      if name == "rand-guid":
+        return str(uuid.uuid4())
+      if name == "datetime":
+        return clock.now().strftime("%Y-%m-%dT%H-%M-%SZ")
+      try:
+        return str(data[name])
+      except (KeyError, TypeError):
+        raise ValueError(f"no value for {match.group(0)} in {self.text}")
+    return EXPRESSION.sub(value, self.text)
+
+def binding_data(trigger):
+  # the values a trigger provides to binding expressions, by lowercase name
+  data = {}
+  if isinstance(trigger, func.ServiceBusMessage):
+    try:
+      body = json.loads(trigger.get_body())
+    except ValueError:
+      body = None
+    if isinstance(body, dict):
+      data.update(body)
+  elif hasattr(trigger, "route_params"): # an HTTP request
+    data.update(trigger.route_params or {})
+    data.update({ f"query.{k}" : v for k, v in trigger.params.items() })
+  return { k.lower() : v for k, v in data.items() }
+
+class BlobBinding(object):
+  def __init__(self, manifest):
+    self.manifest  = manifest
+    self.path      = Template(manifest["path"])
+    self.data_type = manifest.get("dataType")
+
+  def location(self, data):
+    # the container and the name of the blob, which can contain folders
+    container, _, filename = self.path.format(data).partition("/")
+    return container, filename
+
+  def read(self, data):
+    container, filename = self.location(data)
+    blob = StorageAccount.properties(container, filename)
+    if blob is None:
+      return None
+    if self.data_type in ("binary", "string"):
+      content = bytes(StorageAccount.get(container, filename, mapped=False).readall())
+      return content if self.data_type == "binary" else content.decode()
+    return func.InputStream(container, filename, blob.size)
+
+  def write(self, value, data):
+    container, filename = self.location(data)
+    StorageAccount.add(container, filename, value)
+
+class ServiceBusBinding(object):
+  def __init__(self, manifest):
+    self.manifest = manifest
+    self.path     = Template(manifest["queueName"])
+
+  def write(self, value, data):
+    queue = self.path.format(data)
+    for message in value if isinstance(value, list) else [ value ]:
+      if isinstance(message, str):
+        message = message.encode()
+      elif not isinstance(message, (bytes, bytearray)):
+        message = json.dumps(message).encode()
+      StorageAccount.send(queue, message)
+
+class HttpBinding(object):
+  # the response, handed back to the web server
+  def __init__(self, manifest):
+    self.manifest = manifest
+
+OUTPUTS = {
+  "blob"       : BlobBinding,
+  "serviceBus" : ServiceBusBinding,
+  "http"       : HttpBinding
+}
+
+class Plan(object):
+  def __init__(self, name, manifest, parameters):
+    self.name     = name
+    self.inputs   = [] # (parameter, make(trigger, data))
+    self.outputs  = [] # (parameter, binding)
+    self.result   = None # binding receiving the return value
+    self.response = None # parameter with the HTTP response
+    self.dynamic  = False # bindings use the data of the trigger
+    self.reads    = False # input bindings read blobs, blocking
+
+    names = { parameter.lower() : parameter for parameter in parameters }
+    bound = set()
+    trigger = None
+    for binding in manifest.bindings:
+      kind, direction, name = binding.get("type", ""), binding.get("direction"), binding.get("name")
+      if kind.endswith("Trigger"):
+        trigger = binding
+        continue
+      if direction == "out" and not kind in OUTPUTS or \
+         direction == "in"  and kind != "blob":
+        logger.warn(f"⚠️ {name} of {self.name}: unsupported {kind} binding")
+        continue
+      target = OUTPUTS[kind](binding) if direction == "out" else BlobBinding(binding)
+      if hasattr(target, "path"):
+        self.dynamic = self.dynamic or target.path.dynamic
+      if name == "$return":
+        if kind != "http":
+          self.result = target
+        continue
+      parameter = name if name in parameters else names.get(name.lower())
+      if parameter is None:
+        logger.warn(f"⚠️ {self.name} has no parameter for binding {name}")
+        continue
+      bound.add(parameter)
+      if direction == "in":
+        self.reads = True
+        self.inputs.append((parameter, lambda trigger, data, blob=target: blob.read(data)))
+      else:
+        self.outputs.append((parameter, target))
+        if kind == "http":
+          self.response = parameter
+
+    if "context" in parameters and not "context" in bound:
+      bound.add("context")
+      self.inputs.append(("context", self.context))
+    if trigger:
+      name = trigger.get("name", "")
+      parameter = name if name in parameters else names.get(name.lower())
+      if parameter is None or parameter in bound:
+        # e.g. main(request) with a trigger named req: the first free one
+        free = [ p for p in parameters if not p in bound ]
+        parameter = free[0] if free else None
+      if parameter is None:
+        logger.warn(f"⚠️ {self.name} has no parameter for its trigger {name}")
+      else:
+        self.inputs.insert(0, (parameter, lambda trigger, data: trigger))
+
+  def context(self, trigger, data):
+    context = func.Context()
+    context.function_name = self.name
+    return context
+
+  def arguments(self, trigger):
+    # the arguments for an invocation, by parameter name, and its binding data
+    data = binding_data(trigger) if self.dynamic else None
+    kwargs = { parameter : make(trigger, data) for parameter, make in self.inputs }
+    for parameter, _ in self.outputs:
+      kwargs[parameter] = func.Out()
+    return kwargs, data
+
+  def complete(self, kwargs, data, result):
+    # write the outputs of a successful invocation, returns the HTTP response
+    for parameter, binding in self.outputs:
+      value = kwargs[parameter].get()
+      if value is not None and not parameter == self.response:
+        binding.write(value, data)
+    if self.result:
+      if result is not None:
+        self.result.write(result, data)
+      result = None
+    if self.response:
+      result = kwargs[self.response].get()
+    return result
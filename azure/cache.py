@@ -0,0 +1,139 @@
+# response cache for HTTP triggered functions
+#
+# GET functions whose response only depends on their route and query
+# parameters can opt in to have their responses cached, in function.local.json:
+#
+#   "cache" : {
+#     "ttl"        : 60,                    seconds an entry is fresh
+#     "maxEntries" : 1000,                  least recently used go first
+#     "query"      : [ "name" ],            query parameters in the key, all by default
+#     "headers"    : [ "Accept-Language" ], request headers in the key, none by default
+#     "containers" : [ "files" ]            blobs written to these clear the cache
+#   }
+#
+# responses to GET requests, also used for HEAD, are cached per route
+# parameters and the selected query parameters and headers. only 200
+# responses with a body in memory are kept,
+# not when they set cookies or say no-store or private. cached responses get
+# an ETag, unless the function set one, and a matching If-None-Match is
+# answered with 304 Not Modified. ttl follows the clock of the functions.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from urllib.parse import parse_qsl
+
+from azure.clock import clock
+from azure.storage.blob import StorageAccount
+
+def matches(etag, header):
+  # weak comparison of an ETag with an If-None-Match header
+  if header.strip() == "*":
+    return True
+  etag = etag[2:] if etag.startswith("W/") else etag
+  for candidate in header.split(","):
+    candidate = candidate.strip()
+    if candidate.startswith("W/"):
+      candidate = candidate[2:]
+    if candidate == etag:
+      return True
+  return False
+
+class Entry(object):
+  def __init__(self, headers, body, etag, expires):
+    self.headers = headers # without Content-Length, added when finished
+    self.body    = body
+    self.etag    = etag
+    self.expires = expires
+
+class ResponseCache(object):
+  def __init__(self, name, config):
+    self.name        = name
+    self.ttl         = float(config.get("ttl", 60))
+    self.max_entries = int(config.get("maxEntries", 1000))
+    self.query       = config.get("query")
+    self.headers     = [
+      "HTTP_" + header.upper().replace("-", "_") for header in config.get("headers", [])
+    ]
+    self.containers  = set(config.get("containers", []))
+    self.entries     = OrderedDict() # key -> Entry, least recently used first
+    self.lock        = Lock()
+    self.generation  = 0 # bumped when cleared, entries of older requests aren't kept
+    self.watching    = False
+
+  def key(self, environ, params):
+    query = parse_qsl(environ.get("QUERY_STRING", ""), keep_blank_values=True)
+    if self.query is not None:
+      query = [ (k, v) for k, v in query if k in self.query ]
+    return (
+      tuple(sorted((k.lower(), str(v)) for k, v in params.items())),
+      tuple(sorted(query)),
+      tuple(environ.get(header) for header in self.headers)
+    )
+
+  def lookup(self, environ, params):
+    # a cached response, or None and what store needs to cache the response
+    if not environ["REQUEST_METHOD"] in ("GET", "HEAD"):
+      return None, None
+    if not self.watching:
+      self.watch()
+    key = self.key(environ, params)
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry and entry.expires > clock.time():
+        self.entries.move_to_end(key)
+        return self.respond(entry, environ), None
+      if entry:
+        del self.entries[key]
+      return None, (key, self.generation)
+
+  def store(self, miss, environ, status, headers, body):
+    # cache a response, returns it with its ETag, or as 304 when not modified
+    if miss is None or status != 200 or not isinstance(body, bytes):
+      return status, headers, body
+    names = { k.lower() : str(v).lower() for k, v in headers }
+    if "set-cookie" in names or \
+       any(word in names.get("cache-control", "") for word in ("no-store", "private")):
+      return status, headers, body
+    etag = next((v for k, v in headers if k.lower() == "etag"), None)
+    if not etag:
+      etag    = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+      headers = headers + [ ("ETag", etag) ]
+    headers = [ (k, v) for k, v in headers if k.lower() != "content-length" ]
+    entry   = Entry(headers, body, etag, clock.time() + self.ttl)
+    key, generation = miss
+    with self.lock:
+      if generation == self.generation and environ["REQUEST_METHOD"] == "GET":
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+          self.entries.popitem(last=False)
+    return self.respond(entry, environ)
+
+  def respond(self, entry, environ):
+    header = environ.get("HTTP_IF_NONE_MATCH")
+    if header and matches(entry.etag, header):
+      return 304, [ ("ETag", entry.etag) ], b""
+    return 200, list(entry.headers), entry.body
+
+  def watch(self):
+    # blob changes are followed from the first request on
+    with self.lock:
+      if self.watching:
+        return
+      self.watching = True
+    if self.containers:
+      StorageAccount.on_change(self.changed)
+
+  def changed(self, container, filename):
+    if container is None or container in self.containers:
+      self.clear()
+      logger.debug(f"🧹 Cleared cached responses of {self.name}, {container}/{filename} changed")
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.generation += 1
@@ -0,0 +1,148 @@
+# the time source of the fake environment: real or virtual
+#
+# AZURE_CLOCK selects the clock:
+#
+# - real (default) : the system clock
+# - virtual        : runs along with the system clock, from AZURE_CLOCK_START
+#                    (ISO 8601, default now), and can be advanced
+# - fast           : a virtual clock that jumps to the next timer as soon as
+#                    nothing is running anymore
+#
+# the timer scheduler, service bus messages and the time and datetime modules
+# as seen by functions all use this clock.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import time as _time
+import types
+import datetime as _datetime
+from threading import Lock, Condition
+
+MODES = [ "real", "virtual", "fast" ]
+
+class Clock(object):
+  def __init__(self, mode="real", start=None):
+    if not mode in MODES:
+      raise ValueError(f"unknown clock {mode}, use one of {', '.join(MODES)}")
+    self.mode    = mode
+    self.virtual = mode != "real"
+    self.fast    = mode == "fast"
+    self.offset  = 0.0
+    if start:
+      self.offset = _datetime.datetime.fromisoformat(start).timestamp() - _time.time()
+    self.changed   = Condition(Lock())
+    self.listeners = [] # called after the clock was advanced or poked
+    self.checks    = [] # return True when there is work in progress
+    if self.virtual:
+      self.time_module     = virtual_time(self)
+      self.datetime_module = virtual_datetime(self)
+
+  def time(self):
+    return _time.time() + self.offset
+
+  def now(self, tz=_datetime.timezone.utc):
+    return _datetime.datetime.fromtimestamp(self.time(), tz)
+
+  def advance(self, seconds):
+    if not self.virtual:
+      raise ValueError("the real clock can't be advanced, use AZURE_CLOCK=virtual")
+    if seconds <= 0:
+      return
+    with self.changed:
+      self.offset += seconds
+      self.changed.notify_all()
+    logger.debug(f"🕰  advanced the clock by {seconds:.3f}s to {self.now().isoformat()}")
+    self.poke()
+
+  def advance_to(self, when):
+    self.advance(when.timestamp() - self.time())
+
+  def sleep(self, seconds):
+    # wakes up when the clock reaches the deadline, also when advanced
+    if not self.virtual:
+      return _time.sleep(seconds)
+    deadline = self.time() + seconds
+    with self.changed:
+      while True:
+        remaining = deadline - self.time()
+        if remaining <= 0:
+          return
+        self.changed.wait(remaining)
+
+  # fast-forwarding
+
+  def busy(self, check):
+    self.checks.append(check)
+
+  def idle(self):
+    return not any(check() for check in self.checks)
+
+  def on_change(self, listener):
+    self.listeners.append(listener)
+
+  def poke(self):
+    # something changed, e.g. work completed: give listeners a chance to act
+    for listener in self.listeners:
+      listener()
+
+  # the time source of functions
+
+  def patch(self, module):
+    # make a (function) module use this clock for time and datetime
+    if not self.virtual:
+      return
+    for name, value in list(vars(module).items()):
+      if value is _time:
+        setattr(module, name, self.time_module)
+      elif value is _time.time:
+        setattr(module, name, self.time)
+      elif value is _datetime:
+        setattr(module, name, self.datetime_module)
+      elif value is _datetime.datetime:
+        setattr(module, name, self.datetime_module.datetime)
+      elif value is _datetime.date:
+        setattr(module, name, self.datetime_module.date)
+
+def virtual_time(clock):
+  # a time module following the given clock
+  module = types.ModuleType("time")
+  module.__dict__.update(vars(_time))
+  module.time      = clock.time
+  module.time_ns   = lambda: int(clock.time() * 1e9)
+  module.sleep     = clock.sleep
+  module.localtime = lambda secs=None: _time.localtime(clock.time() if secs is None else secs)
+  module.gmtime    = lambda secs=None: _time.gmtime(clock.time() if secs is None else secs)
+  module.ctime     = lambda secs=None: _time.ctime(clock.time() if secs is None else secs)
+  module.strftime  = lambda format, t=None: _time.strftime(format, module.localtime() if t is None else t)
+  return module
+
+def virtual_datetime(clock):
+  # a datetime module following the given clock
+  class datetime(_datetime.datetime):
+    @classmethod
+    def now(cls, tz=None):
+      return _datetime.datetime.fromtimestamp(clock.time(), tz)
+    @classmethod
+    def utcnow(cls):
+      return clock.now().replace(tzinfo=None)
+    @classmethod
+    def today(cls):
+      return cls.now()
+  class date(_datetime.date):
+    @classmethod
+    def today(cls):
+      return _datetime.date.fromtimestamp(clock.time())
+  module = types.ModuleType("datetime")
+  module.__dict__.update(vars(_datetime))
+  module.datetime = datetime
+  module.date     = date
+  return module
+
+clock = Clock(
+  os.environ.get("AZURE_CLOCK", "real"),
+  os.environ.get("AZURE_CLOCK_START")
+)
+if clock.virtual:
+  logger.info(f"🕰  Using a {clock.mode} clock, starting at {clock.now().isoformat()}")
@@ -0,0 +1,46 @@
+# coordination between the worker processes of a single deployment
+#
+# with AZURE_SHARED=1, several processes (e.g. gunicorn -w 4) share a storage
+# account: blob events are delivered through the durable service bus queue,
+# storage changes are broadcast to all workers, and a single elected leader
+# runs the schedules and watches the storage for external changes. the leader
+# holds an exclusive lock on a file in the storage account folder, when it
+# exits the lock is released and the next worker to try takes over.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import fcntl
+from pathlib import Path
+
+shared = os.environ.get("AZURE_SHARED", "0") == "1"
+
+class Leader(object):
+  def __init__(self, path):
+    self.path = path
+    self.fp   = None
+
+  def elected(self):
+    # without sharing, every process leads itself
+    if not shared or self.fp:
+      return True
+    self.path.parent.mkdir(parents=True, exist_ok=True)
+    fp = open(self.path, "a")
+    try:
+      fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+      fp.close()
+      return False
+    self.fp = fp
+    logger.info(f"👑 Worker {os.getpid()} is now the leader")
+    return True
+
+  def after_fork(self):
+    # the lock belongs to the parent, closing our copy keeps it there
+    if self.fp:
+      self.fp.close()
+      self.fp = None
+
+leader = Leader(Path(os.environ.get("AZURE_SA", "local_blob_storage")) / ".leader")
+os.register_at_fork(after_in_child=leader.after_fork)
@@ -0,0 +1,25 @@
+# the exceptions of azure-core that the fake SDKs raise
+
+class AzureError(Exception):
+  def __init__(self, message=None, *args, **kwargs):
+    self.message = str(message)
+    super().__init__(self.message, *args)
+
+class HttpResponseError(AzureError):
+  def __init__(self, message=None, status_code=None, reason=None, **kwargs):
+    self.status_code = status_code
+    self.reason      = reason
+    self.error_code  = kwargs.get("error_code")
+    super().__init__(message)
+
+class ResourceNotFoundError(HttpResponseError):
+  def __init__(self, message=None, **kwargs):
+    kwargs.setdefault("status_code", 404)
+    kwargs.setdefault("reason", "The specified resource does not exist.")
+    super().__init__(message, **kwargs)
+
+class ResourceExistsError(HttpResponseError):
+  def __init__(self, message=None, **kwargs):
+    kwargs.setdefault("status_code", 409)
+    kwargs.setdefault("reason", "The specified resource already exists.")
+    super().__init__(message, **kwargs)
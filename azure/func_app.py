@@ -4,56 +4,73 @@ import logging
 logger = logging.getLogger(__name__)
 
 import os
-import io
+import asyncio
 import sys
 import json
 import importlib
-import uuid
 from datetime import datetime
 import inspect
 
-import schedule
-
-from flask import request, make_response, send_file, redirect
-from flask_restful import Resource, abort
+from werkzeug.wrappers import Request
+from werkzeug.http import HTTP_STATUS_CODES
 
 from azure.storage.blob import StorageAccount
 import azure.functions as func
+from azure import worker
+from azure import batching
+from azure import bindings
+from azure import cache
+from azure import responses
+from azure import loop
+from azure import timers
+from azure.clock import clock
+
+class WsgiHttpRequest(object):
+  # the request passed to HTTP triggered functions
+  def __init__(self, request, route_params):
+    self.request      = request # a werkzeug Request
+    self.route_params = route_params
+
+  def snapshot(self):
+    # a picklable copy of the request
+    return func.HttpRequest(
+      self.method,
+      self.url,
+      headers      = dict(self.headers),
+      params       = dict(self.params),
+      route_params = dict(self.route_params),
+      body         = self.get_body()
+    )
 
-class FlaskHttpRequest(object):
   def get_body(self):
-    return request.get_data()
-  
+    return self.request.get_data()
+
   def get_json(self):
-    return request.get_json()
+    return json.loads(self.get_body())
 
   @property
   def files(self):
-    return request.files
+    return self.request.files
 
   @property
   def form(self):
-    raise NotImplementedError
+    return self.request.form
 
   @property
   def headers(self):
-    return request.headers
+    return self.request.headers
 
   @property
   def params(self):
-    return request.args
-
-  @property
-  def route_params(self):
-    return request.view_args
+    return self.request.args
 
   @property
   def url(self):
-    return request.url
+    return self.request.url
 
   @property
   def method(self):
-    return request.method
+    return self.request.method
 
 class Manifest(object):
   def __init__(self, path):
@@ -77,6 +94,18 @@ class Manifest(object):
         return binding
     return None
 
+  @property
+  def execution(self):
+    return self.manifest.get("execution", "thread")
+
+  @property
+  def cache(self):
+    return self.manifest.get("cache")
+
+  @property
+  def batch(self):
+    return self.manifest.get("batch")
+
   @property
   def http_trigger(self):
     return self.binding(type="httpTrigger", direction="in")
@@ -93,80 +122,127 @@ class Manifest(object):
   def timer_trigger(self):
     return self.binding(type="timerTrigger", direction="in")
 
-class BlobBinding(object):
-  def __init__(self, manifest):
-    self.manifest = manifest
-    path = self.manifest["path"]
-    for k, v in os.environ.items():
-      path = path.replace(f"%{k}%", v)
-    for k, v in os.environ.items():    
-      path = path.replace(k, v)
-    path = path.split("/")
-    self.filename = path.pop()
-    self.container = os.path.join(*path)
-
-  def set(self, data):
-    filename = self.filename.replace("{rand-guid}", str(uuid.uuid4()))
-    StorageAccount.add(self.container, filename, data)
-
-class ResourceWrapper(Resource):
-  def __init__(self, function):
-    self.function = function
-
-  def get(self, *args, **kwargs):
-    if not "get" in self.function.manifest.http_trigger["methods"]: abort(404)
-    return self.execute()
-
-  def post(self, *args, **kwargs):
-    if not "post" in self.function.manifest.http_trigger["methods"]: abort(404)
-    return self.execute()
-
-  def delete(self, *args, **kwargs):
-    if not "delete" in self.function.manifest.http_trigger["methods"]: abort(404)
-    return self.execute()
-
-  def execute(self):
-    # assemble expected args
-    args = [ FlaskHttpRequest() ]
-    if "context" in self.function.parameters:
-      context = func.Context()
-      context.function_name = self.function.name
-      args.append(context)
-    if self.function.manifest.blob_out:
-      args.append( BlobBinding(self.function.manifest.blob_out))
-
-    # call function
-    result = self.function(*args)
-
-    # simple string output
-    if isinstance(result, str):
-      return make_response(result, 200)
-
-    # HttpResponse
-    if isinstance(result, func.HttpResponse):
-  
-      # check for redirect
-      if result.status_code >= 300 and result.status_code < 400:
-        return redirect(result.headers["Location"], result.status_code)
-  
-      data = result.get_body()
-      headers = result.headers
-      if isinstance(data, str):
-        resp = make_response(data, result.status_code)
-        if result.mimetype:
-          resp.mimetype = result.mimetype
-        return resp
-
-      if result.mimetype:
-        return send_file(io.BytesIO(data), mimetype=result.mimetype)
+def respond(result):
+  # the status, headers and body of the response for what a function returned
+  if isinstance(result, str):
+    return 200, [ ("Content-Type", "text/html; charset=utf-8") ], result.encode()
+
+  if isinstance(result, func.HttpResponse):
+    headers = [ (k, str(v)) for k, v in result.headers.items() ]
+    if 300 <= result.status_code < 400 and "Location" in result.headers:
+      return result.status_code, headers, b""
+    body = result.get_body()
+    mimetype = result.mimetype
+    if not mimetype and not "content-type" in { k.lower() for k, _ in headers }:
+      if isinstance(body, str):
+        mimetype = "text/html"
       else:
-        return send_file(io.BytesIO(data), mimetype="application/octet-stream")
-
-    logger.warn(f"⚠️ Unexpected function result: {result}")
-    return make_response("ok", 200)
+        body     = responses.body(body)
+        mimetype = getattr(body, "mimetype", None) or "application/octet-stream"
+    if isinstance(body, str):
+      body = body.encode(result.charset or "utf-8")
+      if mimetype:
+        mimetype = f"{mimetype}; charset={result.charset or 'utf-8'}"
+    else:
+      body = responses.body(body)
+    if mimetype:
+      headers = [ (k, v) for k, v in headers if k.lower() != "content-type" ]
+      headers.append(("Content-Type", mimetype))
+    return result.status_code, headers, body
+
+  logger.warn(f"⚠️ Unexpected function result: {result}")
+  return 200, [ ("Content-Type", "text/html; charset=utf-8") ], b"ok"
+
+class HttpDispatcher(object):
+  # WSGI middleware, dispatching requests under the route prefix straight to
+  # the functions in a route table, everything else goes to the wrapped app
+  def __init__(self, routes, app, prefix="/api"):
+    self.routes = routes
+    self.app    = app
+    self.prefix = prefix.rstrip("/")
+
+  def __call__(self, environ, start_response):
+    found = self.match(environ)
+    if not found:
+      return self.app(environ, start_response) # not ours
+    function, params, allowed = found
+    if function:
+      status, headers, body = self.invoke(function, environ, params)
+    else:
+      status, headers, body = self.reject(environ, allowed)
+    start_response(f"{status} {HTTP_STATUS_CODES.get(status, 'UNKNOWN')}", headers)
+    if environ["REQUEST_METHOD"] == "HEAD":
+      if isinstance(body, responses.Body):
+        body.close()
+      return []
+    if isinstance(body, responses.Body):
+      return body.wsgi(environ) # streamed, closed by the server
+    return [ body ]
+
+  def match(self, environ):
+    # the function, route parameters and allowed methods for a request, or
+    # None if it isn't for a function
+    path = environ.get("PATH_INFO", "")
+    if not (path == self.prefix or path.startswith(self.prefix + "/")):
+      return None
+    method = environ["REQUEST_METHOD"]
+    function, params, allowed = self.routes.match(method, path[len(self.prefix):])
+    if function is None and method == "HEAD":
+      function, params, _ = self.routes.match("GET", path[len(self.prefix):])
+    if function is None and not allowed:
+      return None
+    return function, params, allowed
+
+  def request(self, environ, params):
+    return WsgiHttpRequest(Request(environ), params)
+
+  def invoke(self, function, environ, params):
+    cached, miss = function.cache.lookup(environ, params) if function.cache else (None, None)
+    if cached:
+      return self.finish(*cached, environ)
+    try:
+      request = self.request(environ, params)
+      result  = function.batcher.run(function, request) if function.batcher else function(request)
+      status, headers, body = respond(result)
+    except Exception as e:
+      return self.failed(function, e)
+    if miss:
+      status, headers, body = function.cache.store(miss, environ, status, headers, body)
+    return self.finish(status, headers, body, environ)
+
+  def failed(self, function, e):
+    logger.error(f"🚨  While executing function {function.name}...")
+    logger.exception(e)
+    return self.finish(500, [ ("Content-Type", "text/plain") ], b"Internal Server Error")
+
+  def reject(self, environ, allowed):
+    methods = ", ".join(sorted(allowed)).upper()
+    if environ["REQUEST_METHOD"] == "OPTIONS": # CORS preflight
+      return self.finish(200, [
+        ("Allow", methods),
+        ("Access-Control-Allow-Methods", methods),
+        ("Access-Control-Allow-Headers", environ.get("HTTP_ACCESS_CONTROL_REQUEST_HEADERS", "*"))
+      ], b"")
+    return self.finish(405, [ ("Allow", methods) ], b"")
+
+  def finish(self, status, headers, body, environ=None):
+    if environ and "HTTP_RANGE" in environ and isinstance(body, bytes):
+      body = responses.BufferBody(body)
+    if isinstance(body, responses.Body):
+      if environ:
+        status = responses.ranged(status, headers, body, environ)
+      size = body.size
+    else:
+      size = len(body)
+    if size is not None:
+      # functions may give the length of a body that is streamed
+      headers = [ (k, v) for k, v in headers if k.lower() != "content-length" ]
+      headers.append(("Content-Length", str(size)))
+    headers.append(("Access-Control-Allow-Origin", "*"))
+    return status, headers, body
 
 class Function(object):
-  def __init__(self, subdir, d, api):
+  def __init__(self, subdir, d, routes):
     try:
       self.manifest = Manifest(os.path.join(subdir, d, "function.local.json"))
     except:
@@ -174,20 +250,46 @@ class Function(object):
     pkg = ".".join([subdir.replace("/", "."), d])
     sys.path.append(subdir)
     mod = importlib.import_module(pkg)
+    clock.patch(mod) # functions follow a virtual clock
     self.function = getattr(mod, "main")
     try:
       self.name = mod.__name__
     except:
       self.name = d
+    self.parameters = inspect.signature(self.function).parameters
+    self.plan       = bindings.Plan(self.name, self.manifest, self.parameters)
+
+    self.in_process = self.manifest.execution == "process"
+    if self.in_process:
+      logger.info(f"⚙️  running {self.name} in a worker process")
+      worker.register(self.name, subdir)
+    # coroutines run on the event loop of the host, or in their worker process
+    self.is_async = inspect.iscoroutinefunction(self.function) and not self.in_process
+
+    self.cache = None
+    if self.manifest.http_trigger and self.manifest.cache:
+      logger.info(f"🗃  caching responses of {self.name}")
+      self.cache = cache.ResponseCache(self.name, self.manifest.cache)
+
+    self.batcher = None
+    if self.manifest.http_trigger and self.manifest.batch:
+      if self.is_async:
+        logger.warn(f"⚠️ not batching the writes of async function {self.name}")
+      else:
+        logger.info(f"📦 batching the writes of {self.name}")
+        self.batcher = batching.Batcher(self.name, self.manifest.batch)
 
     if self.manifest.http_trigger:
-      logger.info(f"📍 Setting up API endpoint for {self.name} on {self.manifest.http_trigger['route']}")
-      api.add_resource(
-        ResourceWrapper,
-        *self.route,
-        endpoint=d,
-        resource_class_args=(self,)
-      )
+      # like Azure, the route defaults to the name of the function and all
+      # methods are allowed when none are listed
+      route   = self.manifest.http_trigger.get("route", d)
+      methods = self.manifest.http_trigger.get("methods")
+      try:
+        routes.add(route, methods, self)
+      except ValueError as e:
+        logger.warn(f"⚠️ unsupported route for {self.name}: {e}")
+      else:
+        logger.info(f"📍 Setting up API endpoint for {self.name} on {route}")
 
     if self.manifest.service_bus_trigger:
       queueName = self.manifest.service_bus_trigger["queueName"]
@@ -197,57 +299,60 @@ class Function(object):
       StorageAccount.subscribe(queueName, self)
 
     if self.manifest.timer_trigger:
-      # basic support for limited set of cron schedules ;-)
-      if self.manifest.timer_trigger["schedule"] == "0 */5 * * * *":
-        logger.info(f"⏰ scheduling {self.name} every 5 minutes...")
-        schedule.every(5).minutes.do(self, func.TimerRequest())
-      elif self.manifest.timer_trigger["schedule"] == "*/5 * * * * *":
-        logger.info(f"⏰ scheduling {self.name} every 5 seconds...")
-        schedule.every(5).seconds.do(self, func.TimerRequest())
+      trigger    = self.manifest.timer_trigger
+      expression = trigger["schedule"]
+      for k, v in os.environ.items():
+        expression = expression.replace(f"%{k}%", v)
+      try:
+        timer = timers.Timer(
+          self.name, expression, self,
+          run_on_startup = trigger.get("runOnStartup", False),
+          use_monitor    = trigger.get("useMonitor")
+        )
+      except ValueError as e:
+        logger.warn(f"⚠️ unsupported schedule for {self.name}: {e}")
       else:
-        logger.warn(f"unsupported schedule: {self.manifest.timer_trigger['schedule']}")
-
-  @property
-  def parameters(self):
-    return inspect.signature(self.function).parameters
-
-  @property
-  def route(self):
-    urls = []
-    r = self.manifest.http_trigger["route"]
-    if "{" in r:
-      parts = r.split("/")
-      url = []
-      for part in parts:
-        if part[0] == "{" and part[-1] == "}":
-          if part[1:-1] == "*route":
-            urls.append("/".join(url))
-            url.append("<path:route>")
-          else:
-            if ":" in part:
-              name, typing = part[1:-1].split(":")
-              if typing[-1] == "?":
-                urls.append("/".join(url))
-              url.append(f"<{name}>")
-            else:
-              url.append(f"<{part[1:-1]}>")
-        else:
-          url.append(part)
-      urls.append("/".join(url))
-    else:
-      urls.append(r) # no optional parts, simple route
-    return [ "/api/" + url for url in urls ]
+        logger.info(f"⏰ scheduling {self.name} on {timer.schedule}...")
+        timers.scheduler.add(timer)
 
   def __str__(self):
     return self.name
 
-  def __call__(self, *args, **kwargs):
-    return self.function(*args, **kwargs)
+  def __call__(self, trigger):
+    # invoke with a trigger (request, message or timer) and all other bindings
+    if self.is_async:
+      return self.submit(trigger).result()
+    kwargs, data = self.plan.arguments(trigger)
+    if self.in_process:
+      kwargs = {
+        k : arg.snapshot() if isinstance(arg, WsgiHttpRequest) else arg
+        for k, arg in kwargs.items()
+      }
+      result = worker.run(self, kwargs)
+    else:
+      result = self.function(**kwargs)
+    return self.plan.complete(kwargs, data, result)
+
+  def submit(self, trigger):
+    # invoke an async function on the event loop, returns a future
+    if isinstance(trigger, WsgiHttpRequest):
+      trigger = trigger.snapshot() # the request belongs to the server's thread
+    return loop.submit(self.run(trigger))
+
+  async def run(self, trigger):
+    # blob input bindings are read on a thread, not to block the event loop
+    loop = asyncio.get_running_loop()
+    if self.plan.reads:
+      kwargs, data = await loop.run_in_executor(None, self.plan.arguments, trigger)
+    else:
+      kwargs, data = self.plan.arguments(trigger)
+    result = await self.function(**kwargs)
+    return await loop.run_in_executor(None, self.plan.complete, kwargs, data, result)
 
-def create_app(path, api):
+def create_app(path, routes):
   for subdir, dirs, _ in os.walk(path):
     for d in dirs:
       try:
-        Function(subdir, d, api)
+        Function(subdir, d, routes)
       except FileNotFoundError:
         pass
@@ -1,10 +1,13 @@
+import io
 import json
 import uuid
 
+from azure.clock import clock
+
 class HttpResponse(object):
   def __init__(self, body=None, status_code=None, headers=None, mimetype=None, charset=None):
     self.body        = body
-    self.status_code = status_code
+    self.status_code = 200 if status_code is None else status_code
     self.headers     = {} if headers is None else headers
     self.mimetype    = mimetype
     self.charset     = charset
@@ -14,7 +17,10 @@ class HttpResponse(object):
 
 class ServiceBusMessage(object):
   def __init__(self, body):
-    self.body = json.dumps(body).encode()
+    self.body              = json.dumps(body).encode()
+    self.lock_token        = None
+    self.delivery_count    = 1
+    self.enqueued_time_utc = clock.now()
 
   def get_body(self):
     return self.body
@@ -71,6 +77,34 @@ class ServiceBusMessage(object):
   def metadata(self):
     return "..."
 
+class Out(object):
+  # an output binding, written when the function returns
+  def __init__(self):
+    self.value = None
+
+  def set(self, value):
+    self.value = value
+
+  def get(self):
+    return self.value
+
+class InputStream(object):
+  # a blob input binding, the blob is only read when the function reads it
+  def __init__(self, container, name, length=None):
+    self.container = container
+    self.blob_name = name
+    self.name      = f"{container}/{name}"
+    self.length    = length
+    self.uri       = f"https://fake.blob.core.windows.net/{container}/{name}"
+    self.stream    = None
+
+  def read(self, size=-1):
+    if self.stream is None:
+      from azure.storage.blob import StorageAccount
+      blob = StorageAccount.get(self.container, self.blob_name, mapped=False)
+      self.stream = io.BytesIO(blob.readall())
+    return self.stream.read(size)
+
 class Context():
   def __init__(self):
     self.function_directory = None
@@ -80,5 +114,21 @@ class Context():
     self.retry_context      = None
 
 class TimerRequest():
-  def __init__(self):
-    self. past_due = True
+  def __init__(self, past_due=False, schedule_status=None):
+    self.past_due        = past_due
+    self.schedule_status = schedule_status # { "Last", "Next", "LastUpdated" }
+
+class HttpRequest(object):
+  def __init__(self, method, url, headers=None, params=None, route_params=None, body=b""):
+    self.method       = method
+    self.url          = url
+    self.headers      = {} if headers is None else headers
+    self.params       = {} if params is None else params
+    self.route_params = {} if route_params is None else route_params
+    self.body         = body
+
+  def get_body(self):
+    return self.body
+
+  def get_json(self):
+    return json.loads(self.body)
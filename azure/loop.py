@@ -0,0 +1,46 @@
+# the event loop of the function host, running async functions
+#
+# functions defined with async def run as coroutines on a single event loop,
+# in a thread of its own, that is started when the first one is invoked. while
+# a function awaits I/O, the loop runs others, so concurrent invocations of
+# I/O-bound functions don't take a thread each. work that would block the
+# loop, like writing output bindings, is done on its default thread pool.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import asyncio
+from threading import Thread, Lock
+
+loop   = None
+thread = None
+lock   = Lock()
+
+def after_fork():
+  # the loop thread stays with the parent, a child starts its own when needed
+  global loop, thread, lock
+  loop   = None
+  thread = None
+  lock   = Lock()
+
+os.register_at_fork(after_in_child=after_fork)
+
+def get_loop():
+  global loop, thread
+  with lock:
+    if loop is None:
+      loop   = asyncio.new_event_loop()
+      thread = Thread(target=run, args=(loop,), name="function-loop")
+      thread.daemon = True
+      thread.start()
+  return loop
+
+def run(loop):
+  logger.debug("🔁 Started function host event loop thread.")
+  asyncio.set_event_loop(loop)
+  loop.run_forever()
+
+def submit(coroutine):
+  # schedule a coroutine on the loop, returns a concurrent.futures.Future
+  return asyncio.run_coroutine_threadsafe(coroutine, get_loop())
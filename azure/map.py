@@ -89,6 +89,8 @@ def generate(path, outfile, format):
   with open("storage-queues.json") as fp:
     storage_queues = json.load(fp)
     for st, queue in storage_queues.items():
+      if isinstance(queue, dict):
+        queue = queue["queue"]
       functions[st]    = { "type" : "storage", "out" : [ queue ] }
       functions[queue] = { "type" : "queue",   "out" : [] }
 
@@ -112,8 +114,16 @@ def generate(path, outfile, format):
           }, indent=2))
           assert False
 
-        if manifest.blob_out:
-          functions[name]["out"].append(manifest.blob_out["path"].split("/")[0])
+        for binding in manifest.bindings:
+          if binding.get("direction") != "out":
+            continue
+          if binding.get("type") == "blob":
+            functions[name]["out"].append(binding["path"].split("/")[0])
+          elif binding.get("type") == "serviceBus":
+            queue = binding["queueName"]
+            if not queue in functions:
+              functions[queue] = { "type" : "queue", "out" : [] }
+            functions[name]["out"].append(queue)
 
       except FileNotFoundError:
         pass
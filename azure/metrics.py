@@ -0,0 +1,61 @@
+# minimal in-process metrics: counters and latency histograms
+
+from threading import Lock
+import bisect
+
+# bucket upper bounds in milliseconds
+DEFAULT_BUCKETS = [ .1, .25, .5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000 ]
+
+class Histogram(object):
+  def __init__(self, name, buckets=None):
+    self.name    = name
+    self.buckets = sorted(buckets or DEFAULT_BUCKETS)
+    self.counts  = [ 0 ] * (len(self.buckets) + 1) # last one is +Inf
+    self.count   = 0
+    self.total   = 0.0
+    self.max     = 0.0
+    self.lock    = Lock()
+
+  def observe(self, seconds):
+    ms = seconds * 1000
+    with self.lock:
+      self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+      self.count += 1
+      self.total += ms
+      if ms > self.max:
+        self.max = ms
+
+  def percentile(self, p):
+    # upper bound of the bucket containing the p-th percentile, in ms, at most
+    # the largest observed value
+    with self.lock:
+      if not self.count:
+        return 0.0
+      rank = p / 100 * self.count
+      seen = 0
+      for bound, count in zip(self.buckets, self.counts):
+        seen += count
+        if seen >= rank:
+          return min(bound, self.max)
+      return self.max
+
+  @property
+  def mean(self):
+    return self.total / self.count if self.count else 0.0
+
+  def as_dict(self):
+    with self.lock:
+      buckets = { str(bound) : count for bound, count in zip(self.buckets, self.counts) }
+      buckets["+Inf"] = self.counts[-1]
+    return {
+      "count"   : self.count,
+      "mean_ms" : round(self.mean, 3),
+      "p50_ms"  : round(self.percentile(50), 3),
+      "p99_ms"  : round(self.percentile(99), 3),
+      "max_ms"  : round(self.max, 3),
+      "buckets" : buckets
+    }
+
+  def __str__(self):
+    return f"{self.name}: n={self.count} mean={self.mean:.3f}ms " \
+           f"p50<={self.percentile(50):.3f}ms p99<={self.percentile(99):.3f}ms"
@@ -11,6 +11,7 @@ import json
 from datetime import datetime
 
 from azure import func_app, app_svc
+from azure.routes import RouteTable
 
 import azure.functions as func
 
@@ -26,11 +27,13 @@ class Encoder(json.JSONEncoder):
 
 class MockedAzure(object):
   def __init__(self):
-    self.func_app = []
-    self.app_svc  = None
-    self.server   = None
-    self.socketio = None
-    self.api      = None
+    self.func_app   = []
+    self.app_svc    = None
+    self.server     = None
+    self.socketio   = None
+    self.api        = None
+    self.routes     = RouteTable()
+    self.dispatcher = None
 
   def __str__(self):
     return ""
@@ -63,7 +66,10 @@ class MockedAzure(object):
         "cls"    : Encoder
       }
       for path in self.func_app:
-        func_app.create_app(path, api=self.api)
+        func_app.create_app(path, self.routes)
+      # functions are dispatched straight from their route table
+      self.dispatcher = func_app.HttpDispatcher(self.routes, self.server.wsgi_app)
+      self.server.wsgi_app = self.dispatcher
 
   def run(self):
     self.setup()
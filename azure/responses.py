@@ -0,0 +1,259 @@
+# streamed bodies of HTTP responses
+#
+# the body of a func.HttpResponse doesn't need to be in memory, it can be
+#
+# - an iterable or generator of chunks (bytes or str), also an async one
+# - a file, as a pathlib.Path or a file object opened in binary mode
+# - a blob, as a downloader from download_blob() or a blob input binding
+#
+# these are sent chunk by chunk. files, and blobs of the filesystem backend,
+# are handed to the server as files, so it can use sendfile (gunicorn's
+# wsgi.file_wrapper, the zero-copy send extension of ASGI). bodies of known
+# size, files, blobs and bytes, get a Content-Length and serve Range requests.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import re
+import mimetypes
+
+import azure.functions as func
+from azure import loop
+from azure.storage import backends
+from azure.storage.blob import StorageAccount, StorageStreamDownloader, MappedStreamDownloader
+from azure.storage.blob import aio
+
+CHUNK_SIZE = 256 * 1024
+
+def encode(chunk):
+  if isinstance(chunk, str):
+    return chunk.encode("utf-8")
+  if isinstance(chunk, bytes):
+    return chunk
+  return bytes(chunk)
+
+class Body(object):
+  # a streamed body, iterating it gives its chunks, servers close it when done
+  size     = None  # in bytes, None if unknown
+  ranges   = False # if a part can be sent, with restrict
+  mimetype = None  # when it can be told from the source
+
+  def __iter__(self):
+    return self.chunks()
+
+  def chunks(self):
+    raise NotImplementedError
+
+  def restrict(self, start, end):
+    # only send bytes [start, end)
+    raise NotImplementedError
+
+  def wsgi(self, environ):
+    # the iterable to return to a WSGI server
+    return self
+
+  def close(self):
+    pass
+
+class BufferBody(Body):
+  ranges = True
+
+  def __init__(self, data):
+    self.data = memoryview(data).cast("B") if isinstance(data, memoryview) else data
+    self.size = len(self.data)
+
+  def chunks(self):
+    if isinstance(self.data, bytes):
+      yield self.data
+      return
+    for start in range(0, self.size, CHUNK_SIZE):
+      yield bytes(self.data[start:start+CHUNK_SIZE])
+
+  def restrict(self, start, end):
+    self.data = memoryview(self.data)[start:end]
+    self.size = end - start
+
+class FileBody(Body):
+  # a file, from its current position, or a part of it
+  ranges = True
+
+  def __init__(self, file, offset=None, length=None):
+    if isinstance(file, os.PathLike):
+      self.mimetype = mimetypes.guess_type(os.fspath(file))[0]
+      file = open(file, "rb")
+    self.file   = file
+    self.offset = file.tell() if offset is None else offset
+    self.total  = os.fstat(file.fileno()).st_size
+    available   = max(self.total - self.offset, 0)
+    self.size   = available if length is None else min(length, available)
+
+  def chunks(self):
+    self.file.seek(self.offset)
+    remaining = self.size
+    while remaining > 0:
+      chunk = self.file.read(min(CHUNK_SIZE, remaining))
+      if not chunk:
+        return
+      remaining -= len(chunk)
+      yield chunk
+
+  def restrict(self, start, end):
+    self.offset += start
+    self.size    = end - start
+
+  def wsgi(self, environ):
+    # file wrappers send up to the end of the file, from where it is
+    if "wsgi.file_wrapper" in environ and self.offset + self.size == self.total:
+      self.file.seek(self.offset)
+      return environ["wsgi.file_wrapper"](self.file, CHUNK_SIZE)
+    return self
+
+  def close(self):
+    self.file.close()
+
+class BlobBody(Body):
+  # a blob of a backend without files
+  ranges = True
+
+  def __init__(self, blob, offset, length):
+    self.blob   = blob
+    self.offset = offset
+    self.size   = length
+
+  def chunks(self):
+    for chunk in self.blob.chunks(self.offset, self.size):
+      yield encode(chunk)
+
+  def restrict(self, start, end):
+    self.offset += start
+    self.size    = end - start
+
+class IteratorBody(Body):
+  def __init__(self, iterable):
+    self.iterable = iterable
+
+  def chunks(self):
+    for chunk in self.iterable:
+      if chunk:
+        yield encode(chunk)
+
+  def close(self):
+    if hasattr(self.iterable, "close"):
+      self.iterable.close()
+
+async def next_chunk(iterator):
+  return await iterator.__anext__()
+
+class AsyncIteratorBody(Body):
+  # an async iterable, iterated on the event loop of the host for WSGI
+  # servers, directly with achunks on ASGI servers
+  def __init__(self, iterable):
+    self.iterable = iterable
+
+  def chunks(self):
+    iterator = self.iterable.__aiter__()
+    while True:
+      try:
+        chunk = loop.submit(next_chunk(iterator)).result()
+      except StopAsyncIteration:
+        return
+      if chunk:
+        yield encode(chunk)
+
+  async def achunks(self):
+    async for chunk in self.iterable:
+      if chunk:
+        yield encode(chunk)
+
+  def close(self):
+    if hasattr(self.iterable, "aclose"):
+      loop.submit(self.iterable.aclose()).result()
+
+  async def aclose(self):
+    if hasattr(self.iterable, "aclose"):
+      await self.iterable.aclose()
+
+def blob(downloader):
+  mimetype = mimetypes.guess_type(downloader.name)[0]
+  if isinstance(downloader, MappedStreamDownloader):
+    body = BufferBody(downloader.view)
+  elif isinstance(downloader.blob, backends.FileBlob):
+    body = FileBody(open(downloader.blob.path, "rb"), downloader.offset, downloader.size)
+  else:
+    body = BlobBody(downloader.blob, downloader.offset, downloader.size)
+  body.mimetype = mimetype
+  return body
+
+def body(value):
+  # the bytes or streamed Body for the body of a response
+  if value is None:
+    return b""
+  if isinstance(value, (bytes, Body)):
+    return value
+  if isinstance(value, str):
+    return value.encode("utf-8")
+  if isinstance(value, (bytearray, memoryview)):
+    return BufferBody(value)
+  if isinstance(value, os.PathLike):
+    return FileBody(value)
+  if isinstance(value, aio.StorageStreamDownloader):
+    value = value.downloader
+  if isinstance(value, StorageStreamDownloader):
+    return blob(value)
+  if isinstance(value, func.InputStream):
+    if value.stream is None: # not read yet, stream it from the blob
+      return blob(StorageAccount.get(value.container, value.blob_name, mapped=False))
+    return BufferBody(value.read())
+  if hasattr(value, "read"): # a file object
+    try:
+      value.fileno()
+      return FileBody(value)
+    except (AttributeError, OSError, ValueError):
+      return IteratorBody(iter(lambda: value.read(CHUNK_SIZE), b""))
+  if hasattr(value, "__aiter__"):
+    return AsyncIteratorBody(value)
+  return IteratorBody(value)
+
+def byte_range(header, size):
+  # the [start, end) of a single byte range, None if it should be ignored and
+  # the whole body sent, False if it can't be satisfied
+  match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", header)
+  if not match:
+    return None # also multiple ranges
+  first, last = match.groups()
+  if first == "":
+    if last == "":
+      return None
+    if int(last) == 0:
+      return False
+    return max(size - int(last), 0), size # a suffix, the last bytes
+  start = int(first)
+  if last != "" and int(last) < start:
+    return None
+  if start >= size:
+    return False
+  return start, size if last == "" else min(int(last) + 1, size)
+
+def ranged(status, headers, body, environ):
+  # serve the Range of a request, if any, returns the status
+  if not body.ranges or status != 200:
+    return status
+  headers.append(("Accept-Ranges", "bytes"))
+  header = environ.get("HTTP_RANGE")
+  if not header or not environ["REQUEST_METHOD"] in ("GET", "HEAD"):
+    return status
+  if_range = environ.get("HTTP_IF_RANGE")
+  if if_range and not (if_range, ) == tuple(v for k, v in headers if k.lower() == "etag"):
+    return status # changed since, send all of it
+  part = byte_range(header, body.size)
+  if part is None:
+    return status
+  if part is False:
+    headers.append(("Content-Range", f"bytes */{body.size}"))
+    body.restrict(0, 0)
+    return 416
+  start, end = part
+  headers.append(("Content-Range", f"bytes {start}-{end - 1}/{body.size}"))
+  body.restrict(start, end)
+  return 206
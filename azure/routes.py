@@ -0,0 +1,282 @@
+# route table for HTTP triggered functions
+#
+# routes follow the templates of Azure Functions (ASP.NET Core routing):
+#
+#   products/{category:alpha}/{id:int?}
+#   files/{name}.{ext}
+#   static/{*path}
+#
+# a parameter can have constraints (int, long, bool, alpha, guid, datetime,
+# decimal, double, float, minlength(n), maxlength(n), length(n), length(a,b),
+# min(n), max(n), range(a,b) and regex(expression)), combined as {id:int:min(1)},
+# be optional, {id?}, or have a default value, {page=1}. trailing optional
+# parameters also match without them and {*path} catches the rest of the path.
+# matching ignores case and trailing slashes.
+#
+# routes are compiled into a tree of path segments: literal segments are looked
+# up in a dict, parameters are tried in order of specificity, so matching
+# doesn't depend on the number of routes. a path can be matched by routes with
+# different methods, a method that matches none of them is not allowed.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import re
+import uuid
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+def tokenize(segment):
+  # the literals and parameters of a path segment, alternating, e.g. {name}.{ext}
+  # gives [ "", ("name",), ".", ("ext",), "" ]. {{ and }} escape braces.
+  tokens, literal, i = [], "", 0
+  while i < len(segment):
+    if segment.startswith("{{", i) or segment.startswith("}}", i):
+      literal += segment[i]
+      i += 2
+    elif segment[i] == "{":
+      tokens.append(literal)
+      literal, i = "", i + 1
+      parameter = ""
+      while i < len(segment):
+        if segment.startswith("{{", i) or segment.startswith("}}", i):
+          parameter += segment[i]
+          i += 2
+        elif segment[i] == "}":
+          break
+        else:
+          parameter += segment[i]
+          i += 1
+      else:
+        raise ValueError(f"unterminated parameter in {segment}")
+      tokens.append((parameter, ))
+      i += 1
+    else:
+      literal += segment[i]
+      i += 1
+  tokens.append(literal)
+  return tokens
+
+def single(segment):
+  # the parameter of a segment consisting of just one, or None
+  tokens = tokenize(segment)
+  if len(tokens) == 3 and tokens[0] == tokens[2] == "":
+    return Parameter(tokens[1][0])
+  return None
+
+def split(text, separator):
+  # split on a separator, outside of parentheses, e.g. in regex(a:b)
+  parts, depth, start = [], 0, 0
+  for i, c in enumerate(text):
+    if c == "(":
+      depth += 1
+    elif c == ")":
+      depth -= 1
+    elif c == separator and depth == 0:
+      parts.append(text[start:i])
+      start = i + 1
+  parts.append(text[start:])
+  return parts
+
+def is_number(kind):
+  def check(value):
+    try:
+      kind(value)
+      return True
+    except (ValueError, InvalidOperation):
+      return False
+  return check
+
+def is_integer(bits):
+  limit = 2 ** (bits - 1)
+  def check(value):
+    return bool(re.fullmatch(r"-?[0-9]+", value)) and -limit <= int(value) < limit
+  return check
+
+def is_datetime(value):
+  try:
+    datetime.fromisoformat(value)
+    return True
+  except ValueError:
+    return False
+
+def is_guid(value):
+  try:
+    uuid.UUID(value)
+    return True
+  except ValueError:
+    return False
+
+CONSTRAINTS = {
+  "int"      : lambda: is_integer(32),
+  "long"     : lambda: is_integer(64),
+  "bool"     : lambda: lambda v: v.lower() in ("true", "false"),
+  "alpha"    : lambda: lambda v: bool(re.fullmatch(r"[a-zA-Z]+", v)),
+  "guid"     : lambda: is_guid,
+  "datetime" : lambda: is_datetime,
+  "decimal"  : lambda: is_number(Decimal),
+  "double"   : lambda: is_number(float),
+  "float"    : lambda: is_number(float),
+  "minlength": lambda n: lambda v: len(v) >= int(n),
+  "maxlength": lambda n: lambda v: len(v) <= int(n),
+  "length"   : lambda a, b=None: (lambda v: len(v) == int(a)) if b is None else \
+                                 (lambda v: int(a) <= len(v) <= int(b)),
+  "min"      : lambda n: lambda v: is_integer(64)(v) and int(v) >= int(n),
+  "max"      : lambda n: lambda v: is_integer(64)(v) and int(v) <= int(n),
+  "range"    : lambda a, b: lambda v: is_integer(64)(v) and int(a) <= int(v) <= int(b)
+}
+
+def constraint(text):
+  name, _, args = text.partition("(")
+  name = name.strip().lower()
+  if name == "regex":
+    expression = re.compile(args[:-1], re.IGNORECASE)
+    return lambda v: bool(expression.fullmatch(v))
+  if not name in CONSTRAINTS:
+    raise ValueError(f"unknown route constraint: {text}")
+  args = [ arg.strip() for arg in args[:-1].split(",") ] if args else []
+  return CONSTRAINTS[name](*args)
+
+class Parameter(object):
+  def __init__(self, text):
+    self.catch_all = text.startswith("*")
+    text = text.lstrip("*")
+    self.optional = text.endswith("?")
+    text = text[:-1] if self.optional else text
+    text, *default = split(text, "=")
+    self.default = "=".join(default) or None
+    name, *constraints = split(text, ":")
+    self.name   = name.strip()
+    self.checks = [ constraint(c) for c in constraints ]
+
+  def accepts(self, value):
+    return all(check(value) for check in self.checks)
+
+class Segment(object):
+  # a path segment with one or more parameters, e.g. {id:int} or {name}.{ext}
+  def __init__(self, text):
+    self.text       = text
+    self.parameters = []
+    pattern = ""
+    tokens  = tokenize(text)
+    for token in tokens:
+      if isinstance(token, tuple):
+        pattern += "(.+)" # like ASP.NET, the last parameter gets the shortest value
+        self.parameters.append(Parameter(token[0]))
+      else:
+        pattern += re.escape(token)
+    self.simple  = len(tokens) == 3 and tokens[0] == tokens[2] == ""
+    self.pattern = re.compile(pattern, re.IGNORECASE | re.DOTALL)
+    # literals and constraints make a segment more specific
+    self.specificity = (
+      0 if self.simple else 2,
+      sum(len(p.checks) > 0 for p in self.parameters)
+    )
+
+  def match(self, value):
+    # the parameter values of a matching segment, or None
+    if self.simple:
+      parameter = self.parameters[0]
+      return { parameter.name : value } if parameter.accepts(value) else None
+    match = self.pattern.fullmatch(value)
+    if not match:
+      return None
+    values = {}
+    for parameter, value in zip(self.parameters, match.groups()):
+      if not parameter.accepts(value):
+        return None
+      values[parameter.name] = value
+    return values
+
+class Node(object):
+  def __init__(self):
+    self.literals  = {} # lowercase segment -> Node
+    self.patterns  = {} # segment text -> (Segment, Node), most specific first
+    self.catch_all = [] # (Parameter, methods, target, defaults)
+    self.endpoints = [] # (methods, target, defaults)
+
+  def child(self, text):
+    tokens = tokenize(text)
+    if len(tokens) == 1:
+      return self.literals.setdefault(tokens[0].lower(), Node())
+    if not text in self.patterns:
+      self.patterns[text] = (Segment(text), Node())
+      self.patterns = dict(sorted(
+        self.patterns.items(), key=lambda item: item[1][0].specificity, reverse=True
+      ))
+    return self.patterns[text][1]
+
+  def find(self, segments, i, method, params, allowed):
+    if i == len(segments):
+      for methods, target, defaults in self.endpoints:
+        if methods is None or method in methods:
+          return target, { **defaults, **params }
+        allowed.update(methods)
+    else:
+      child = self.literals.get(segments[i].lower())
+      if child:
+        found = child.find(segments, i + 1, method, params, allowed)
+        if found:
+          return found
+      for segment, child in self.patterns.values():
+        values = segment.match(segments[i])
+        if values is not None:
+          found = child.find(segments, i + 1, method, { **params, **values }, allowed)
+          if found:
+            return found
+    rest = "/".join(segments[i:])
+    for parameter, methods, target, defaults in self.catch_all:
+      if rest and not parameter.accepts(rest):
+        continue
+      if methods is None or method in methods:
+        values = { **defaults, **params }
+        if rest:
+          values[parameter.name] = rest
+        return target, values
+      allowed.update(methods)
+    return None
+
+class RouteTable(object):
+  def __init__(self):
+    self.root   = Node()
+    self.routes = [] # (template, methods, target)
+
+  def add(self, template, methods, target):
+    # methods is a collection of lowercase method names, or None for all
+    methods  = None if methods is None else set(m.lower() for m in methods)
+    segments = [ s for s in template.split("/") if s ]
+    parameters = [ single(segment) for segment in segments ]
+    if any(p and p.catch_all for p in parameters[:-1]):
+      raise ValueError(f"a catch-all parameter must be the last segment: {template}")
+    # trailing optional parameters and parameters with a default make the
+    # route also match without them
+    variants = [ (segments, {}) ]
+    while segments and parameters[len(segments) - 1]:
+      parameter = parameters[len(segments) - 1]
+      if not (parameter.optional or parameter.default is not None):
+        break
+      segments = segments[:-1]
+      defaults = dict(variants[-1][1])
+      if parameter.default is not None:
+        defaults[parameter.name] = parameter.default
+      variants.append((segments, defaults))
+    for segments, defaults in variants:
+      node = self.root
+      last = parameters[len(segments) - 1] if segments else None
+      catch_all = last is not None and last.catch_all
+      for segment in segments[:-1] if catch_all else segments:
+        node = node.child(segment)
+      if catch_all:
+        node.catch_all.append((last, methods, target, defaults))
+      else:
+        node.endpoints.append((methods, target, defaults))
+    self.routes.append((template, methods, target))
+
+  def match(self, method, path):
+    # returns the target and route parameters, or None and the methods the
+    # path does allow, none if it doesn't match any route at all
+    allowed = set()
+    found   = self.root.find([ s for s in path.split("/") if s ], 0, method.lower(), {}, allowed)
+    if found:
+      return found[0], found[1], allowed
+    return None, None, allowed
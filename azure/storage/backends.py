@@ -0,0 +1,323 @@
+# storage backends for the blobs of the fake storage account
+#
+# a backend stores blob content per container and name. the storage account
+# keeps everything else (catalog, tags, events) itself. the backend is chosen
+# with AZURE_SA_BACKEND:
+#
+# - filesystem (default) : a folder per container, a file per blob
+# - memory               : blobs in a dict, no disk I/O at all
+# - sqlite               : all blobs in a single SQLite database
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import time
+import uuid
+import mmap
+import shutil
+import sqlite3
+from threading import Lock
+
+from azure.core.exceptions import ResourceNotFoundError
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# folders in the storage account folder that aren't containers
+RESERVED = [ ".uploads", ".spill", ".timers" ]
+
+def not_found(container, name=None):
+  if name is None:
+    return ResourceNotFoundError(f"The specified container does not exist: {container}")
+  return ResourceNotFoundError(f"The specified blob does not exist: {container}/{name}")
+
+# blobs, as returned by backends to read their content
+
+class Blob(object):
+  def __init__(self, size):
+    self.size = size
+
+  def read(self, offset, length):
+    raise NotImplementedError
+
+  def chunks(self, offset, length):
+    end = offset + length
+    while offset < end:
+      chunk = self.read(offset, min(CHUNK_SIZE, end - offset))
+      if not chunk:
+        return
+      offset += len(chunk)
+      yield chunk
+
+  def view(self, offset, length):
+    # zero-copy access, when the backend can offer it
+    return memoryview(self.read(offset, length))
+
+class FileBlob(Blob):
+  def __init__(self, path):
+    super().__init__(os.path.getsize(path))
+    self.path = path
+
+  def read(self, offset, length):
+    with open(self.path, "rb") as fp:
+      fp.seek(offset)
+      return fp.read(length)
+
+  def chunks(self, offset, length):
+    with open(self.path, "rb") as fp:
+      fp.seek(offset)
+      remaining = length
+      while remaining > 0:
+        chunk = fp.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+          return
+        remaining -= len(chunk)
+        yield chunk
+
+  def view(self, offset, length):
+    with open(self.path, "rb") as fp:
+      try:
+        self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+      except ValueError: # empty files can't be mapped
+        self.map = b""
+    return memoryview(self.map)[offset:offset+length]
+
+class MemoryBlob(Blob):
+  def __init__(self, data):
+    super().__init__(len(data))
+    self.data = data
+
+  def read(self, offset, length):
+    return self.data[offset:offset+length]
+
+  def view(self, offset, length):
+    return memoryview(self.data)[offset:offset+length]
+
+class SQLiteBlob(Blob):
+  def __init__(self, backend, rowid, size):
+    super().__init__(size)
+    self.backend = backend
+    self.rowid   = rowid
+
+  def read(self, offset, length):
+    with self.backend.lock:
+      try:
+        with self.backend.db.blobopen("blobs", "data", self.rowid, readonly=True) as blob:
+          blob.seek(offset)
+          return blob.read(length)
+      except sqlite3.OperationalError: # replaced or removed in the meantime
+        return b""
+
+# backends
+
+class FileSystemBackend(object):
+  def __init__(self, root):
+    self.root       = root
+    self.containers = {} # resolved paths of containers known to exist
+    self.uploads    = os.path.join(root, ".uploads")
+    os.makedirs(self.uploads, exist_ok=True)
+
+  def container_path(self, container, create=False):
+    try:
+      return self.containers[container]
+    except KeyError:
+      pass
+    path = os.path.join(self.root, container)
+    if create:
+      os.makedirs(path, exist_ok=True)
+    elif not os.path.isdir(path):
+      raise not_found(container)
+    self.containers[container] = path
+    return path
+
+  def write(self, container, name, chunks, commit=True):
+    # returns the size and modification time (ns) of the written blob. with
+    # commit=False, backends with transactions leave it to commit()
+    target = os.path.join(self.container_path(container, create=True), name)
+    # write to a temporary file first, so readers never see a partial blob
+    temp   = os.path.join(self.uploads, str(uuid.uuid4()))
+    size   = 0
+    try:
+      try:
+        fp = open(temp, "wb")
+      except FileNotFoundError: # the storage account folder was removed
+        os.makedirs(self.uploads, exist_ok=True)
+        fp = open(temp, "wb")
+      with fp:
+        for chunk in chunks:
+          fp.write(chunk)
+          size += len(chunk)
+        fp.flush()
+        mtime = os.fstat(fp.fileno()).st_mtime_ns
+      try:
+        os.replace(temp, target)
+      except FileNotFoundError: # a folder in the blob name, or a removed container
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(temp, target)
+      temp = None
+    finally:
+      if temp:
+        os.remove(temp)
+    return size, mtime
+
+  def commit(self):
+    pass
+
+  def open(self, container, name):
+    try:
+      return FileBlob(os.path.join(self.container_path(container), name))
+    except FileNotFoundError:
+      raise not_found(container, name)
+
+  def exists(self, container, name):
+    try:
+      return os.path.isfile(os.path.join(self.container_path(container), name))
+    except ResourceNotFoundError:
+      return False
+
+  def scan(self):
+    # all blobs: { container : { name : (size, mtime) } }
+    found = {}
+    try:
+      containers = [
+        entry.name for entry in os.scandir(self.root)
+        if entry.is_dir() and not entry.name in RESERVED
+      ]
+    except FileNotFoundError:
+      containers = []
+    for container in containers:
+      found[container] = {}
+      path = os.path.join(self.root, container)
+      for folder, _, files in os.walk(path):
+        for filename in files:
+          full = os.path.join(folder, filename)
+          stat = os.stat(full)
+          name = os.path.relpath(full, path).replace(os.sep, "/")
+          found[container][name] = (stat.st_size, stat.st_mtime_ns)
+    return found
+
+  def reset(self):
+    for container in self.scan():
+      shutil.rmtree(os.path.join(self.root, container), ignore_errors=True)
+    self.containers = {}
+
+class MemoryBackend(object):
+  def __init__(self, root=None):
+    self.blobs = {} # container -> name -> (data, mtime)
+
+  def write(self, container, name, chunks, commit=True):
+    data  = b"".join(chunks)
+    mtime = time.time_ns()
+    self.blobs.setdefault(container, {})[name] = (data, mtime)
+    return len(data), mtime
+
+  def commit(self):
+    pass
+
+  def open(self, container, name):
+    if not container in self.blobs:
+      raise not_found(container)
+    try:
+      return MemoryBlob(self.blobs[container][name][0])
+    except KeyError:
+      raise not_found(container, name)
+
+  def exists(self, container, name):
+    return name in self.blobs.get(container, {})
+
+  def scan(self):
+    return {
+      container : { name : (len(data), mtime) for name, (data, mtime) in blobs.items() }
+      for container, blobs in self.blobs.items()
+    }
+
+  def reset(self):
+    self.blobs = {}
+
+class SQLiteBackend(object):
+  # blobs are buffered in memory while writing, this backend targets many
+  # small blobs, avoiding a file per blob
+
+  def __init__(self, root):
+    os.makedirs(root, exist_ok=True)
+    self.lock = Lock()
+    self.db   = sqlite3.connect(
+      os.path.join(root, "blobs.db"), check_same_thread=False
+    )
+    self.db.execute("PRAGMA journal_mode=WAL")
+    self.db.execute("PRAGMA synchronous=NORMAL")
+    self.db.execute(
+      "CREATE TABLE IF NOT EXISTS blobs ("
+      "  container TEXT NOT NULL, name TEXT NOT NULL,"
+      "  size INTEGER NOT NULL, mtime INTEGER NOT NULL, data BLOB NOT NULL,"
+      "  UNIQUE (container, name)"
+      ")"
+    )
+    self.db.commit()
+
+  def write(self, container, name, chunks, commit=True):
+    data  = b"".join(chunks)
+    mtime = time.time_ns()
+    with self.lock:
+      self.db.execute(
+        "INSERT OR REPLACE INTO blobs (container, name, size, mtime, data) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (container, name, len(data), mtime, data)
+      )
+      if commit:
+        self.db.commit()
+    return len(data), mtime
+
+  def commit(self):
+    # uncommitted blobs can already be read, through the same connection
+    with self.lock:
+      self.db.commit()
+
+  def open(self, container, name):
+    with self.lock:
+      row = self.db.execute(
+        "SELECT rowid, size FROM blobs WHERE container = ? AND name = ?",
+        (container, name)
+      ).fetchone()
+      if not row:
+        if not self.db.execute(
+          "SELECT 1 FROM blobs WHERE container = ? LIMIT 1", (container,)
+        ).fetchone():
+          raise not_found(container)
+        raise not_found(container, name)
+    return SQLiteBlob(self, *row)
+
+  def exists(self, container, name):
+    with self.lock:
+      return self.db.execute(
+        "SELECT 1 FROM blobs WHERE container = ? AND name = ?", (container, name)
+      ).fetchone() is not None
+
+  def scan(self):
+    found = {}
+    with self.lock:
+      for container, name, size, mtime in self.db.execute(
+        "SELECT container, name, size, mtime FROM blobs"
+      ):
+        found.setdefault(container, {})[name] = (size, mtime)
+    return found
+
+  def reset(self):
+    with self.lock:
+      self.db.execute("DELETE FROM blobs")
+      self.db.commit()
+
+BACKENDS = {
+  "filesystem" : FileSystemBackend,
+  "memory"     : MemoryBackend,
+  "sqlite"     : SQLiteBackend
+}
+
+def create(root):
+  name = os.environ.get("AZURE_SA_BACKEND", "filesystem")
+  try:
+    backend = BACKENDS[name]
+  except KeyError:
+    raise ValueError(f"unknown storage backend {name}, use one of {', '.join(BACKENDS)}")
+  logger.debug(f"🗄  Using {name} backend")
+  return backend(root)
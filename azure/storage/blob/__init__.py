@@ -0,0 +1,685 @@
+# basic implementation of storage account service
+
+__version__ = "fake-azure"
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import json
+
+from pathlib import Path
+from threading import Thread, Lock, Event, local
+import time
+import uuid
+from queue import Queue, Empty
+
+import azure.functions as func
+from azure import cluster
+from azure.metrics import Histogram
+from azure.clock import clock
+from azure.storage.dispatch import Dispatcher
+from azure.storage.servicebus import DurableQueue
+from azure.storage.events import EventLog
+from azure.storage.tags import TagIndex, TagJournal, parse
+from azure.storage.catalog import Catalog
+from azure.storage import backends
+
+class Storage(object):
+  def __init__(self):
+    self.root = Path(os.environ.get("AZURE_SA", "local_blob_storage"))
+    logger.debug(f"🗄  Constructing a fake Storage Account in {self.root}.")
+    # storage queues map a container to a queue, either by name or as an
+    # object with the queue name and its concurrency limits
+    self.storage_queues = {}
+    self.queue_limits   = {}
+    try:
+      with open("storage-queues.json") as fp:
+        for container, queue in json.load(fp).items():
+          if isinstance(queue, dict):
+            self.queue_limits[queue["queue"]] = {
+              k:v for k,v in queue.items() if k != "queue"
+            }
+            queue = queue["queue"]
+          self.storage_queues[container] = queue
+          logger.debug(f"🔈 Notifying changes to {container} via {queue}")
+    except FileNotFoundError:
+      logger.warn("⚠️  No storage queues defined !!!")
+      logger.warn("   👉 To map blob events to service bus event queues")
+      logger.warn("      create a storage-queues.json configuration.")
+
+    self.backend = backends.create(self.root)
+    self.mapped  = os.environ.get("AZURE_BLOB_MMAP", "0") == "1"
+    self.catalog = Catalog(self.backend)
+    self.catalog.on_created = self.found
+
+    # the memory backend doesn't touch the disk, so tags aren't persisted
+    in_memory    = isinstance(self.backend, backends.MemoryBackend)
+    self.journal = TagJournal(None if in_memory else self.root)
+    self.tags    = self.journal.load()
+
+    self.indexes = {}
+    for container, blobs in self.tags.items():
+      index = self.indexes[container] = TagIndex()
+      for filename, tags in blobs.items():
+        index.add(filename, tags)
+
+    self.subscriptions = {}
+    self.outbox        = Queue()
+    self.listeners     = [] # called with the container and name of changed blobs
+    self.local         = local() # writes of this thread deferred until commit
+
+    # the notifier dispatches up to batch_size messages per wake-up, waiting at
+    # most batch_wait seconds for a batch to fill up (default: no waiting)
+    self.batch_size = int(os.environ.get("AZURE_SB_BATCH_SIZE", 32))
+    self.batch_wait = float(os.environ.get("AZURE_SB_BATCH_WAIT", 0))
+    self.latency    = Histogram("🔈 enqueue to dispatch latency")
+
+    self.dispatcher = Dispatcher(self.root, self.subscriptions, self.queue_limits)
+    clock.busy(self.busy)
+
+    # service bus messages are kept in memory, or in a durable queue, which
+    # is shared by all workers when sharing the storage account
+    self.bus = None
+    if cluster.shared or os.environ.get("AZURE_SB_BACKEND", "memory") == "sqlite":
+      self.bus = DurableQueue(self.root / "servicebus.db", shared=cluster.shared)
+      self.dispatcher.bus = self.bus
+    self.redelivered = time.monotonic()
+
+    # when shared, changes are exchanged with the other workers, which are
+    # polled for changes and messages every poll seconds, or right away after
+    # a local change
+    self.events    = None
+    self.announced = {} # (container, name, mtime) -> time, of blobs created by workers
+    if cluster.shared:
+      self.events = EventLog(self.root / "events.db")
+      self.poll   = float(os.environ.get("AZURE_SHARED_POLL", .1))
+      self.wakeup = Event()
+      self.synced = Lock()
+      self.pruned = time.monotonic()
+
+    # without subscriptions there is nothing to notify, the notifier thread is
+    # started with the first subscription, or right away to poll for changes
+    self.notifier = None
+    if cluster.shared:
+      self.start_notifier()
+
+  def busy(self):
+    # pending events, for fast-forwarding the clock
+    return not self.outbox.empty() or self.dispatcher.busy()
+
+  def start_notifier(self):
+    self.notifier = Thread(target=self.run_notifier, args=())
+    self.notifier.daemon = True
+    self.notifier.start()
+
+  def after_fork(self):
+    # threads don't survive a fork: recreate them, and all locks, in the child.
+    # pending work stays with the parent.
+    self.outbox = Queue()
+    self.dispatcher.after_fork()
+    self.journal.after_fork()
+    self.catalog.after_fork()
+    if self.bus:
+      self.bus.after_fork()
+    if self.events:
+      self.events.after_fork()
+      self.wakeup = Event()
+      self.synced = Lock()
+    if self.subscriptions or self.events:
+      self.start_notifier()
+
+  def run_notifier(self):
+    logger.debug("🔈 Started Storage Account notifier thread.")
+    if self.events:
+      return self.run_shared_notifier()
+    while True:
+      for (queue, function, msg, enqueued) in self.next_batch():
+        self.latency.observe(time.monotonic() - enqueued)
+        self.dispatcher.submit(queue, function, msg)
+      if self.bus and time.monotonic() - self.redelivered > self.bus.lock_duration:
+        self.redeliver()
+
+  def run_shared_notifier(self):
+    # messages are only taken from the shared queue, when there is room to
+    # run them, leaving the rest to the other workers
+    while True:
+      self.wakeup.wait(self.poll)
+      self.wakeup.clear()
+      try:
+        self.sync()
+        self.redeliver()
+      except Exception as e:
+        logger.error(f"🚨  While polling shared storage...")
+        logger.exception(e)
+
+  def sync(self):
+    # apply the changes of other workers
+    with self.synced:
+      changes = self.apply(self.events.poll())
+    if changes:
+      logger.debug(f"📣 Applied {len(changes)} changes of other workers")
+    if time.monotonic() - self.pruned > self.events.retention and cluster.leader.elected():
+      self.pruned = time.monotonic()
+      self.events.prune()
+      with self.synced:
+        expired = time.monotonic() - self.events.retention
+        for key in [ key for key, when in self.announced.items() if when < expired ]:
+          del self.announced[key]
+
+  def apply(self, changes):
+    for kind, container, name, data in changes:
+      if kind == "created":
+        self.catalog.add(container, name, data["size"], data["mtime"])
+        self.announced[(container, name, data["mtime"])] = time.monotonic()
+        self.changed(container, name)
+      elif kind == "tagged":
+        self.index_tags(container, name, data)
+        self.journal.replicated()
+      elif kind == "reset":
+        self.catalog.reset()
+        self.changed()
+        with self.journal.lock:
+          self.tags.clear()
+          self.indexes.clear()
+    return changes
+
+  def next_batch(self):
+    # block until at least one message is available, then gather more
+    # with a durable queue, wake up regularly to redeliver abandoned messages
+    try:
+      batch = [ self.outbox.get(timeout=self.bus.lock_duration if self.bus else None) ]
+    except Empty:
+      return []
+    deadline = time.monotonic() + self.batch_wait
+    while len(batch) < self.batch_size:
+      try:
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+          batch.append(self.outbox.get(timeout=remaining))
+        else:
+          batch.append(self.outbox.get_nowait())
+      except Empty:
+        break
+    return batch
+
+  def subscribe(self, queue, function):
+    try:
+      self.subscriptions[queue].append(function)
+    except KeyError:
+      self.subscriptions[queue] = [ function ]
+    logger.debug(f"🗄  Set up subscription on {queue} for {function}.")
+    if not self.notifier:
+      self.start_notifier()
+    if self.bus:
+      self.redeliver(queue, function)
+
+  def redeliver(self, queue=None, function=None):
+    # (re)deliver available messages from the durable queue, as long as there
+    # is room in the dispatcher, or, when shared, to run them right away
+    self.redelivered = time.monotonic()
+    if queue:
+      subscriptions = { queue : [ function ] }
+    else:
+      subscriptions = dict(self.subscriptions)
+    for queue, functions in subscriptions.items():
+      for function in functions:
+        while (not self.events or self.dispatcher.room() > 0) and \
+              self.dispatcher.slots.acquire(blocking=False):
+          received = self.bus.receive(queue, function.name)
+          if not received:
+            self.dispatcher.slots.release()
+            break
+          token, body, count = received[0]
+          logger.debug(f"🚌 Redelivering message {token} to {function} ({count})")
+          msg = func.ServiceBusMessage(None)
+          msg.body, msg.lock_token, msg.delivery_count = body, token, count
+          self.dispatcher.count("queued", 1)
+          self.dispatcher.submit(queue, function, msg)
+
+  def add(self, container, filename, data):
+    deferred = getattr(self.local, "deferred", None)
+    size, mtime = self.backend.write(container, filename, chunked(data), commit=deferred is None)
+    self.catalog.add(container, filename, size, mtime)
+    logger.debug(f"🗄  Created {filename} in {container}.")
+    self.changed(container, filename)
+    if deferred is not None:
+      deferred.append(("created", container, filename, { "size" : size, "mtime" : mtime }))
+      return
+    if self.events:
+      self.events.publish("created", container, filename, { "size" : size, "mtime" : mtime })
+    self.notify(container, filename, size)
+
+  # writes can be committed in groups: between collect and collected, the
+  # blobs a thread writes can be read right away, but their transaction,
+  # shared change and events are deferred, to be committed together with
+  # those of other threads
+
+  def collect(self):
+    self.local.deferred = []
+
+  def collected(self):
+    deferred, self.local.deferred = self.local.deferred, None
+    return deferred
+
+  def commit(self, deferred):
+    self.backend.commit()
+    if self.events:
+      changes = [ change for change in deferred if change[0] in ("created", "tagged") ]
+      if changes:
+        self.events.publish_all(changes)
+    messages = []
+    for kind, container, name, data in deferred:
+      if kind == "created":
+        message = self.event(container, name, data["size"])
+        if message:
+          messages.append(message)
+      elif kind == "sent":
+        messages.append((container, data)) # the queue and body
+    self.send_all(messages)
+
+  def on_change(self, listener):
+    self.listeners.append(listener)
+
+  def changed(self, container=None, filename=None):
+    # a blob was created or changed, or all of them when reset
+    for listener in self.listeners:
+      try:
+        listener(container, filename)
+      except Exception as e:
+        logger.error(f"🚨  While handling a change of {container}/{filename}...")
+        logger.exception(e)
+
+  def found(self, container, entry):
+    # a blob was created or changed outside of the storage account. when
+    # shared, only the leader notifies, and not for blobs other workers
+    # created, but whose change hadn't reached us yet
+    self.changed(container, entry.name)
+    if self.events:
+      if not cluster.leader.elected():
+        return
+      self.sync()
+      if (container, entry.name, entry.mtime) in self.announced:
+        return
+    self.notify(container, entry.name, entry.size)
+
+  def tag(self, container, filename, tags):
+    tags = { k:str(v) for k,v in tags.items() }
+    with self.journal.lock:
+      self.index_tags(container, filename, tags)
+      self.journal.append(container, filename, tags)
+    if self.events:
+      deferred = getattr(self.local, "deferred", None)
+      if deferred is not None:
+        deferred.append(("tagged", container, filename, tags))
+      else:
+        self.events.publish("tagged", container, filename, tags)
+
+  def index_tags(self, container, filename, tags):
+    with self.journal.lock:
+      if not container in self.tags:
+        self.tags[container]    = {}
+        self.indexes[container] = TagIndex()
+      index = self.indexes[container]
+      index.remove(filename, self.tags[container].get(filename, {}))
+      self.tags[container][filename] = tags
+      index.add(filename, tags)
+
+  def get_tags(self, container, filename):
+    try:
+      return dict(self.tags[container][filename])
+    except KeyError:
+      pass
+    return {} 
+
+  def find_blobs_by_tags(self, exp):
+    # e.g. @container = 'mycontainer' AND "Name" = 'C'
+    # e.g. "Status" = 'todo' AND "TimeToSend" <= '1666519548' (all containers)
+    query = parse(exp)
+    logger.debug(f"🔎 looking for {query}")
+    with self.journal.lock:
+      if query.container is None:
+        containers = sorted(self.indexes)
+      else:
+        containers = [ query.container ] if query.container in self.indexes else []
+      matches = []
+      for container in containers:
+        tags = self.tags[container]
+        for filename in query.execute(self.indexes[container], tags):
+          # hand out a copy, the index relies on the stored tags
+          matches.append(BlobProperties(container, filename, dict(tags[filename])))
+    for blob in matches:
+      logger.debug(f"  - match: {blob.container}/{blob.name} : {blob.tags}")
+      yield blob
+
+  def notify(self, container, filename, size):
+    message = self.event(container, filename, size)
+    if message:
+      self.send(*message)
+
+  def event(self, container, filename, size):
+    # the queue and body of the event for a created blob, None without queue
+    queue = self.storage_queues.get(container, None)
+    if not queue:
+      logger.warn(f"⚠️ No queue for {container}")
+      return None
+    return queue, json.dumps({
+      "topic": "...",
+      "subject": f"/blobServices/default/containers/{container}/blobs/{filename}",
+      "eventType": "Microsoft.Storage.BlobCreated",
+      "id": str(uuid.uuid4()),
+      "data": {
+        "api": "PutBlockList",
+        "clientRequestId": str(uuid.uuid4()),
+        "requestId": str(uuid.uuid4()),
+        "eTag": "...",
+        "contentType": "application/octet-stream",
+        "contentLength": size,
+        "blobType": "BlockBlob",
+        "url": f"https://fake.blob.core.windows.net/{container}/{filename}",
+        "sequencer": "...",
+        "storageDiagnostics": {
+          "batchId": "..."
+        }
+      },
+      "dataVersion": "",
+      "metadataVersion": "1",
+      "eventTime": clock.now().replace(tzinfo=None).isoformat()
+    }).encode()
+
+  def send(self, queue, body):
+    # deliver a message to every function subscribed to a queue
+    self.send_all([ (queue, body) ])
+
+  def send_all(self, messages):
+    # deliver (queue, body) messages, durable ones are stored in one go
+    deferred = getattr(self.local, "deferred", None)
+    if deferred is not None:
+      deferred.extend(("sent", queue, None, body) for queue, body in messages)
+      return
+    admitted = []
+    for queue, body in messages:
+      subscriptions = self.subscriptions.get(queue, None)
+      if not subscriptions:
+        logger.warn(f"⚠️ No subscription on {queue}")
+        continue
+      for function in subscriptions:
+        logger.debug(f"🔈 Notifying {function}")
+        msg = func.ServiceBusMessage(None)
+        msg.body = body
+        if self.events: # one of the workers will pick it up
+          admitted.append((queue, function, msg))
+          continue
+        if admitted and self.dispatcher.slots.acquire(blocking=False):
+          self.dispatcher.count("queued", 1)
+        else:
+          # don't hold on to admitted messages while waiting for room
+          self.deliver(admitted)
+          admitted = []
+          if not self.dispatcher.admit(queue, function, msg):
+            continue
+        admitted.append((queue, function, msg))
+    self.deliver(admitted)
+
+  def deliver(self, admitted):
+    if not admitted:
+      return
+    if self.bus:
+      tokens = self.bus.send_all([
+        (queue, function.name, msg.body, not self.events) for queue, function, msg in admitted
+      ])
+      for (_, _, msg), token in zip(admitted, tokens):
+        msg.lock_token = token
+    if self.events:
+      self.wakeup.set()
+      return
+    for queue, function, msg in admitted:
+      self.outbox.put((queue, function, msg, time.monotonic()))
+
+  def list(self, container, prefix=None, start_after=None, limit=None):
+    for entry in self.catalog.list(container, prefix, start_after, limit):
+      yield BlobProperties(
+        container, entry.name, self.get_tags(container, entry.name),
+        size=entry.size, last_modified=entry.last_modified, etag=entry.etag
+      )
+
+  def get(self, container, filename, offset=None, length=None, mapped=None):
+    if mapped is None:
+      mapped = self.mapped
+    downloader = MappedStreamDownloader if mapped else StorageStreamDownloader
+    blob = self.backend.open(container, filename)
+    return downloader(container, filename, blob, offset, length)
+
+  def exists(self, container, filename):
+    return self.backend.exists(container, filename)
+
+  def properties(self, container, filename):
+    # from the catalog, without touching the backend, None if there's no blob
+    entry = self.catalog.get(container, filename)
+    if entry is None:
+      return None
+    return BlobProperties(
+      container, entry.name, self.get_tags(container, entry.name),
+      size=entry.size, last_modified=entry.last_modified, etag=entry.etag
+    )
+
+  def reset(self):
+    # remove all blobs and tags
+    self.backend.reset()
+    self.catalog.reset()
+    self.changed()
+    with self.journal.write_lock, self.journal.lock:
+      self.journal.reset()
+      self.indexes.clear()
+    if self.events:
+      self.events.publish("reset")
+
+class LazyStorage(object):
+  # the storage account is only constructed on first use, so importing the
+  # SDK doesn't read configuration or start threads
+  def __init__(self):
+    object.__setattr__(self, "storage", None)
+    object.__setattr__(self, "instance_lock", Lock())
+
+  def instance(self):
+    storage = object.__getattribute__(self, "storage")
+    if storage is None:
+      with object.__getattribute__(self, "instance_lock"):
+        storage = object.__getattribute__(self, "storage")
+        if storage is None:
+          storage = Storage()
+          object.__setattr__(self, "storage", storage)
+    return storage
+
+  def __getattr__(self, name):
+    return getattr(object.__getattribute__(self, "instance")(), name)
+
+  def __setattr__(self, name, value):
+    setattr(object.__getattribute__(self, "instance")(), name, value)
+
+  def use(self, storage):
+    # stand in another storage account, e.g. forwarding calls to another process
+    object.__setattr__(self, "storage", storage)
+
+  def after_fork(self):
+    object.__setattr__(self, "instance_lock", Lock())
+    storage = object.__getattribute__(self, "storage")
+    if storage is not None:
+      storage.after_fork()
+
+StorageAccount = LazyStorage()
+os.register_at_fork(after_in_child=StorageAccount.after_fork)
+
+CHUNK_SIZE = backends.CHUNK_SIZE
+
+def chunked(data):
+  # yields chunks of bytes from bytes, str, a file-like object or an iterable
+  if isinstance(data, (bytes, bytearray, memoryview)):
+    yield data
+  elif isinstance(data, str):
+    yield data.encode()
+  elif hasattr(data, "read"):
+    while True:
+      chunk = data.read(CHUNK_SIZE)
+      if not chunk:
+        break
+      yield chunk.encode() if isinstance(chunk, str) else chunk
+  else:
+    for chunk in data:
+      yield chunk.encode() if isinstance(chunk, str) else chunk
+
+class BlobProperties(object):
+  def __init__(self, container, name, tags, size=None, last_modified=None, etag=None):
+    self.container     = container
+    self.name          = name
+    self.tags          = tags
+    self.size          = size
+    self.last_modified = last_modified
+    self.etag          = etag
+
+class ItemPaged(object):
+  # iterable over all items, or page by page using by_page(). the
+  # continuation token is the name of the last blob of the previous page.
+  def __init__(self, container, prefix=None, results_per_page=None):
+    self.container        = container
+    self.prefix           = prefix
+    self.results_per_page = results_per_page or 5000
+
+  def __iter__(self):
+    for page in self.by_page():
+      yield from page
+
+  def by_page(self, continuation_token=None):
+    while True:
+      page = list(StorageAccount.list(
+        self.container, self.prefix, continuation_token, self.results_per_page
+      ))
+      if page:
+        yield iter(page)
+      if len(page) < self.results_per_page:
+        return
+      continuation_token = page[-1].name
+
+class BlobClient(object):
+  def __init__(self, name, container):
+    self.name = name
+    self.container = container
+  
+  def upload_blob(self, data, tags=None, overwrite=True):
+    # data can be bytes, str, a file-like object or an iterable of chunks
+    StorageAccount.add(self.container, self.name, data)
+    if tags:
+      self.set_blob_tags(tags)
+
+  def set_blob_tags(self, tags):
+    StorageAccount.tag(self.container, self.name, tags)
+
+  def get_blob_tags(self):
+    return StorageAccount.get_tags(self.container, self.name)
+
+  def exists(self):
+    return StorageAccount.exists(self.container, self.name)
+
+  def download_blob(self, offset=None, length=None, mapped=None):
+    return StorageAccount.get(self.container, self.name, offset, length, mapped)
+
+class StorageStreamDownloader(object):
+  def __init__(self, container, name, blob, offset=None, length=None):
+    self.container = container
+    self.name      = name
+    self.blob      = blob
+    self.offset    = offset or 0
+    available      = max(blob.size - self.offset, 0)
+    self.size      = available if length is None else min(length, available)
+
+  def chunks(self):
+    return self.blob.chunks(self.offset, self.size)
+
+  def readall(self):
+    return self.blob.read(self.offset, self.size)
+
+  def content_as_bytes(self):
+    return self.readall()
+
+  def content_as_text(self, encoding="UTF-8"):
+    return self.readall().decode(encoding)
+
+  def readinto(self, stream):
+    # like the SDK: writes the blob to the stream, returns the number of bytes
+    count = 0
+    for chunk in self.chunks():
+      stream.write(chunk)
+      count += len(chunk)
+    return count
+
+  def download_to_stream(self, stream):
+    self.readinto(stream)
+    return self
+
+class MappedStreamDownloader(StorageStreamDownloader):
+  # zero-copy downloader: the blob content is handed out as memoryview slices,
+  # over a memory-mapped file with the filesystem backend. use
+  # str(data, "utf-8") instead of data.decode() to turn the content in text.
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.view = self.blob.view(self.offset, self.size)
+
+  def chunks(self):
+    for start in range(0, self.size, CHUNK_SIZE):
+      yield self.view[start:start+CHUNK_SIZE]
+
+  def readall(self):
+    return self.view
+
+  def content_as_bytes(self):
+    return bytes(self.view)
+
+  def content_as_text(self, encoding="UTF-8"):
+    return str(self.view, encoding)
+
+  def readinto(self, stream):
+    stream.write(self.view)
+    return self.size
+
+class ContainerClient(object):
+  def __init__(self, container):
+    self.container = container
+  
+  def list_blobs(self, name_starts_with=None, results_per_page=None):
+    return ItemPaged(self.container, name_starts_with, results_per_page)
+
+  def download_blob(self, filename, offset=None, length=None, mapped=None):
+    return StorageAccount.get(self.container, filename, offset, length, mapped)
+
+  def get_blob_client(self, filename):
+    return BlobClient(filename, self.container)
+
+class BlobServiceClient(object):
+  @classmethod
+  def from_connection_string(cls, connection_string):
+    return BlobServiceClient()
+
+  def get_container_client(self, container):
+    return ContainerClient(container)
+
+  def find_blobs_by_tags(self, exp):
+    return StorageAccount.find_blobs_by_tags(exp)
+
+class BlockBlobService():
+  def __init__(self, account_name=None, account_key=None):
+    pass
+
+  def generate_blob_shared_access_signature(self,
+    container_name, blob_name, permission, until):
+    return "something"
+
+  def make_blob_url(self, container_name, blob_name, sas_token=None):
+    return f"http://localhost:5000/unknown/{container_name}/{blob_name}"
+
+class BlobPermissions():
+  ADD    = 0
+  CREATE = 1
+  DELETE = 2
+  READ   = 4
+  WRITE  = 8
@@ -0,0 +1,147 @@
+# asyncio variant of the fake blob storage SDK
+#
+# all file I/O is done by the synchronous StorageAccount, on a bounded thread
+# pool, so the event loop is never blocked. the pool is shared by all clients
+# and sized with AZURE_BLOB_AIO_THREADS.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import asyncio
+import functools
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.storage.blob import StorageAccount, ItemPaged
+
+PAGE_SIZE = 100
+
+executor = ThreadPoolExecutor(
+  max_workers        = int(os.environ.get("AZURE_BLOB_AIO_THREADS", 32)),
+  thread_name_prefix = "blob-aio"
+)
+
+async def run(f, *args, **kwargs):
+  loop = asyncio.get_running_loop()
+  return await loop.run_in_executor(executor, functools.partial(f, *args, **kwargs))
+
+async def paged(generator, size=PAGE_SIZE):
+  # turn a blocking generator into an async iterator, fetching pages of items
+  # on the executor
+  iterator = iter(generator)
+  while True:
+    page = await run(lambda: list(islice(iterator, size)))
+    for item in page:
+      yield item
+    if len(page) < size:
+      return
+
+async def next_chunk(iterator):
+  return await iterator.__anext__()
+
+class ClientBase(object):
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *args):
+    await self.close()
+
+  async def close(self):
+    pass
+
+class BlobClient(ClientBase):
+  def __init__(self, name, container):
+    self.name      = name
+    self.container = container
+
+  async def upload_blob(self, data, tags=None, overwrite=True):
+    # data can also be an async iterable of chunks. the writing thread pulls
+    # them from the event loop, which stays free while the upload waits: no
+    # other thread of the pool is needed, however many uploads are running
+    if hasattr(data, "__aiter__"):
+      loop     = asyncio.get_running_loop()
+      iterator = data.__aiter__()
+      def consume():
+        while True:
+          try:
+            yield asyncio.run_coroutine_threadsafe(next_chunk(iterator), loop).result()
+          except StopAsyncIteration:
+            return
+      await run(StorageAccount.add, self.container, self.name, consume())
+    else:
+      await run(StorageAccount.add, self.container, self.name, data)
+    if tags:
+      await self.set_blob_tags(tags)
+
+  async def set_blob_tags(self, tags):
+    await run(StorageAccount.tag, self.container, self.name, tags)
+
+  async def get_blob_tags(self):
+    return StorageAccount.get_tags(self.container, self.name)
+
+  async def exists(self):
+    return await run(StorageAccount.exists, self.container, self.name)
+
+  async def download_blob(self, offset=None, length=None, mapped=None):
+    return StorageStreamDownloader(await run(
+      StorageAccount.get, self.container, self.name, offset, length, mapped
+    ))
+
+class StorageStreamDownloader(object):
+  def __init__(self, downloader):
+    self.downloader = downloader
+    self.container  = downloader.container
+    self.name       = downloader.name
+    self.size       = downloader.size
+
+  async def chunks(self):
+    async for chunk in paged(self.downloader.chunks(), size=1):
+      yield chunk
+
+  async def readall(self):
+    return await run(self.downloader.readall)
+
+  async def content_as_bytes(self):
+    return await run(self.downloader.content_as_bytes)
+
+  async def content_as_text(self, encoding="UTF-8"):
+    return str(await self.readall(), encoding)
+
+  async def readinto(self, stream):
+    # stream.write may be a coroutine function, as with async file objects
+    count = 0
+    async for chunk in self.chunks():
+      written = stream.write(chunk)
+      if asyncio.iscoroutine(written):
+        await written
+      count += len(chunk)
+    return count
+
+  async def download_to_stream(self, stream):
+    await self.readinto(stream)
+    return self
+
+class ContainerClient(ClientBase):
+  def __init__(self, container):
+    self.container = container
+
+  def list_blobs(self, name_starts_with=None, results_per_page=None):
+    return paged(ItemPaged(self.container, name_starts_with, results_per_page))
+
+  async def download_blob(self, filename, offset=None, length=None, mapped=None):
+    return await self.get_blob_client(filename).download_blob(offset, length, mapped)
+
+  def get_blob_client(self, filename):
+    return BlobClient(filename, self.container)
+
+class BlobServiceClient(ClientBase):
+  @classmethod
+  def from_connection_string(cls, connection_string):
+    return BlobServiceClient()
+
+  def get_container_client(self, container):
+    return ContainerClient(container)
+
+  def find_blobs_by_tags(self, exp):
+    return paged(StorageAccount.find_blobs_by_tags(exp))
@@ -0,0 +1,138 @@
+# in-memory catalog of the blobs in each container
+#
+# the catalog is built once by scanning the storage backend and kept up to
+# date by Storage.add. blob names are kept in a sorted list, so listings with
+# a name prefix and pagination don't touch the backend. optionally a watcher
+# rescans the backend every AZURE_SA_WATCH seconds, to pick up files that were
+# added, changed or removed outside of the storage account.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import time
+from datetime import datetime, timezone
+from threading import Thread, Lock
+
+from azure.storage.tags import SortedList
+
+class BlobEntry(object):
+  def __init__(self, name, size, mtime):
+    self.name  = name
+    self.size  = size
+    self.mtime = mtime # in ns
+
+  @property
+  def etag(self):
+    return f'"0x{self.mtime:X}{self.size:X}"'
+
+  @property
+  def last_modified(self):
+    return datetime.fromtimestamp(self.mtime / 1e9, tz=timezone.utc)
+
+class Catalog(object):
+  def __init__(self, backend):
+    self.backend    = backend
+    self.lock       = Lock()
+    self.blobs      = {} # container -> name -> BlobEntry
+    self.names      = {} # container -> SortedList of names
+    self.on_created = None
+
+    self.scan()
+    self.watch()
+
+  def watch(self):
+    interval = float(os.environ.get("AZURE_SA_WATCH", 0))
+    if interval > 0:
+      self.watcher = Thread(target=self.run_watcher, args=(interval,))
+      self.watcher.daemon = True
+      self.watcher.start()
+
+  def after_fork(self):
+    self.lock = Lock()
+    self.watch()
+
+  def scan(self):
+    started = time.time_ns()
+    found   = {
+      container : {
+        name : BlobEntry(name, size, mtime) for name, (size, mtime) in blobs.items()
+      }
+      for container, blobs in self.backend.scan().items()
+    }
+    return self.update(found, started)
+
+  def update(self, found, started):
+    # align the catalog with what was found, returns the added/changed blobs.
+    # blobs added after the scan started are kept, even if not found.
+    changed = []
+    with self.lock:
+      for container, blobs in found.items():
+        known = self.blobs.get(container, {})
+        for name, entry in blobs.items():
+          previous = known.get(name)
+          if not previous or previous.mtime != entry.mtime or previous.size != entry.size:
+            changed.append((container, entry))
+      for container, known in self.blobs.items():
+        blobs = found.get(container, {})
+        for name in [ name for name in known if not name in blobs ]:
+          if known[name].mtime < started:
+            self.remove(container, name)
+    for container, entry in changed:
+      self.add(container, entry.name, entry.size, entry.mtime)
+    return changed
+
+  def run_watcher(self, interval):
+    logger.debug(f"👀 Watching storage for changes every {interval}s")
+    while True:
+      time.sleep(interval)
+      try:
+        changed = self.scan()
+      except OSError as e:
+        logger.warn(f"⚠️ While scanning storage: {e}")
+        continue
+      for container, entry in changed:
+        logger.debug(f"👀 Found {entry.name} in {container}")
+        if self.on_created:
+          self.on_created(container, entry)
+
+  def add(self, container, name, size, mtime=None):
+    if mtime is None:
+      mtime = time.time_ns()
+    with self.lock:
+      if not container in self.blobs:
+        self.blobs[container] = {}
+        self.names[container] = SortedList()
+      if not name in self.blobs[container]:
+        self.names[container].add(name)
+      self.blobs[container][name] = BlobEntry(name, size, mtime)
+
+  def remove(self, container, name):
+    # called with lock held
+    if self.blobs.get(container, {}).pop(name, None):
+      self.names[container].remove(name)
+
+  def reset(self):
+    with self.lock:
+      self.blobs = {}
+      self.names = {}
+
+  def get(self, container, name):
+    return self.blobs.get(container, {}).get(name)
+
+  def list(self, container, prefix=None, start_after=None, limit=None):
+    # entries in name order, with an optional name prefix, starting after a
+    # given name (the continuation token) and up to limit entries
+    with self.lock:
+      if not container in self.names:
+        return []
+      lo = prefix or None
+      if start_after is not None and (lo is None or start_after >= lo):
+        lo = start_after + "\0"
+      hi = prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix else None
+      entries = []
+      for name in self.names[container].irange(lo, hi):
+        entries.append(self.blobs[container][name])
+        if limit and len(entries) == limit:
+          break
+      return entries
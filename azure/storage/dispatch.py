@@ -0,0 +1,271 @@
+# bounded, backpressure-aware dispatching of service bus messages to functions
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import json
+import uuid
+import time
+from threading import Lock, BoundedSemaphore
+from collections import deque, OrderedDict
+
+import azure.functions as func
+from azure.clock import clock
+
+OVERFLOW_POLICIES = [ "block", "drop", "spill" ]
+
+class Dispatcher(object):
+  def __init__(self, root, subscriptions, limits=None):
+    self.pool_size   = int(os.environ.get("AZURE_SB_POOL_SIZE", 10))
+    self.max_pending = int(os.environ.get("AZURE_SB_MAX_PENDING", 1000))
+    self.overflow    = os.environ.get("AZURE_SB_OVERFLOW", "block")
+    if not self.overflow in OVERFLOW_POLICIES:
+      logger.warn(f"⚠️ unknown overflow policy {self.overflow}, using block")
+      self.overflow = "block"
+    self.queue_concurrency    = int(os.environ.get(
+      "AZURE_SB_QUEUE_CONCURRENCY", self.pool_size
+    ))
+    self.function_concurrency = int(os.environ.get(
+      "AZURE_SB_FUNCTION_CONCURRENCY", self.pool_size
+    ))
+    # async functions don't take a pool thread while running
+    self.async_concurrency = int(os.environ.get("AZURE_SB_ASYNC_CONCURRENCY", 100))
+    # per queue overrides: { queue : { "concurrency" : n, "function_concurrency" : m } }
+    self.limits = limits or {}
+    self.subscriptions = subscriptions
+    self.bus = None # optional durable queue to settle messages with
+
+    self.spill_dir = root / ".spill"
+
+    self.reset()
+    logger.debug(
+      f"🔈 Dispatching with {self.pool_size} threads, max {self.max_pending} "
+      f"pending, {self.overflow} on overflow."
+    )
+
+  def reset(self):
+    # (re)initialize all threading state, also in a forked child process,
+    # where the parent's work stays with the parent
+    self.pool     = None           # created on first use
+    self.lock     = Lock()
+    self.slots    = BoundedSemaphore(self.max_pending)
+    self.pending  = OrderedDict()  # (queue, function name) -> deque of work
+    self.running  = {}             # queue or (queue, function name) -> count
+    self.counters = {
+      "in_flight" : 0,
+      "queued"    : 0,
+      "rejected"  : 0,
+      "spilled"   : 0,
+      "completed" : 0,
+      "failed"    : 0,
+      "retried"   : 0,
+      "dead_lettered" : 0
+    }
+
+  def after_fork(self):
+    self.reset()
+
+  # producer side
+
+  def admit(self, queue, function, msg):
+    # acquire a pending slot for a message, applying the overflow policy when
+    # none is available. returns False if the message was not admitted.
+    if self.slots.acquire(blocking=self.overflow == "block"):
+      self.count("queued", 1)
+      return True
+    if self.overflow == "spill":
+      self.spill(queue, function, msg)
+    else:
+      logger.warn(f"⚠️ Dropping message for {function} on {queue}: too much pending work")
+      self.count("rejected", 1)
+    return False
+
+  # consumer side
+
+  def submit(self, queue, function, msg):
+    with self.lock:
+      key = (queue, function.name)
+      if not key in self.pending:
+        self.pending[key] = deque()
+      self.pending[key].append((function, msg))
+    self.schedule()
+
+  def schedule(self):
+    started = []
+    with self.lock:
+      # round robin over all functions with pending work
+      for key in list(self.pending):
+        queue, _ = key
+        work = self.pending[key]
+        while work and self.can_run(queue, work[0][0]):
+          function, msg = work.popleft()
+          self.start(queue, function, msg)
+          started.append((queue, function, msg))
+        if not work:
+          del self.pending[key]
+        else:
+          self.pending.move_to_end(key)
+      if started and self.pool is None:
+        # multiprocessing is only imported when there is work to dispatch
+        from multiprocessing.dummy import Pool
+        self.pool = Pool(processes=self.pool_size)
+    for queue, function, msg in started:
+      self.launch(queue, function, msg)
+
+  def can_run(self, queue, function):
+    limits = self.limits.get(queue, {})
+    if getattr(function, "is_async", False):
+      queue_limit = function_limit = self.async_concurrency
+    else:
+      queue_limit, function_limit = self.queue_concurrency, self.function_concurrency
+    queue_limit    = limits.get("concurrency", queue_limit)
+    function_limit = limits.get("function_concurrency", function_limit)
+    return self.running.get(queue, 0) < queue_limit and \
+           self.running.get((queue, function.name), 0) < function_limit
+
+  def start(self, queue, function, msg):
+    # called with lock held
+    self.running[queue] = self.running.get(queue, 0) + 1
+    self.running[(queue, function.name)] = self.running.get((queue, function.name), 0) + 1
+    self.counters["queued"]    -= 1
+    self.counters["in_flight"] += 1
+    self.slots.release()
+
+  def launch(self, queue, function, msg):
+    def done(result):
+      self.finish(queue, function.name, result)
+    if getattr(function, "is_async", False):
+      # async functions run on the event loop of the host, a pool thread only
+      # settles the message once it is done
+      def settle(future):
+        self.pool.apply_async(
+          self.execute, [queue, function, msg, future],
+          callback=done, error_callback=done
+        )
+      function.submit(msg).add_done_callback(settle)
+      return
+    self.pool.apply_async(
+      self.execute, [queue, function, msg], callback=done, error_callback=done
+    )
+
+  def execute(self, queue, function, msg, future=None):
+    # runs a function, or takes the outcome of an async one from its future
+    try:
+      if future is None:
+        function(msg)
+      else:
+        future.result()
+      self.settle(queue, function, msg, True)
+      return True
+    except Exception as e:
+      logger.error(f"🚨  While executing function {function.name}...")
+      logger.exception(e)
+      self.settle(queue, function, msg, False)
+      return False
+
+  def settle(self, queue, function, msg, success):
+    if not self.bus or msg.lock_token is None:
+      return
+    if success:
+      self.bus.complete(msg.lock_token)
+    elif not self.bus.abandon(msg.lock_token):
+      logger.error(f"☠️  Dead-lettered message for {function} after {msg.delivery_count} deliveries")
+      self.count("dead_lettered", 1)
+    else:
+      # retry right away if there is room, else it's picked up by redelivery
+      self.count("retried", 1)
+      if self.slots.acquire(blocking=False):
+        self.count("queued", 1)
+        for token, body, count in self.bus.receive(queue, function.name):
+          retry = func.ServiceBusMessage(None)
+          retry.body, retry.lock_token, retry.delivery_count = body, token, count
+          self.submit(queue, function, retry)
+          break
+        else:
+          self.count("queued", -1)
+          self.slots.release()
+
+  def finish(self, queue, name, result):
+    with self.lock:
+      self.running[queue] -= 1
+      self.running[(queue, name)] -= 1
+      self.counters["in_flight"] -= 1
+      self.counters["completed" if result is True else "failed"] += 1
+      spilled = self.counters["spilled"]
+    if clock.fast: # fast-forwarding waits for work to complete
+      clock.poke()
+    if spilled:
+      for queue, function, msg in self.unspill():
+        with self.lock:
+          if not (queue, function.name) in self.pending:
+            self.pending[(queue, function.name)] = deque()
+          self.pending[(queue, function.name)].append((function, msg))
+    self.schedule()
+
+  # spilling to disk
+
+  def spill(self, queue, function, msg):
+    if self.bus: # keep it unlocked in the durable queue, until redelivery
+      self.bus.send(queue, function.name, msg.get_body(), lock=False)
+      logger.debug(f"🔈 Spilled message for {function} on {queue} to the durable queue")
+      return
+    self.spill_dir.mkdir(parents=True, exist_ok=True)
+    record = {
+      "queue"    : queue,
+      "function" : function.name,
+      "body"     : msg.get_body().decode()
+    }
+    # time based names keep spilled messages in order
+    name = f"{time.time_ns():020d}-{uuid.uuid4()}.json"
+    with open(self.spill_dir / name, "w") as fp:
+      json.dump(record, fp)
+    self.count("spilled", 1)
+    logger.debug(f"🔈 Spilled message for {function} on {queue} to disk")
+
+  def unspill(self):
+    # yields spilled messages, oldest first, as long as pending slots are
+    # available. each yielded message holds a slot.
+    try:
+      names = sorted(os.listdir(self.spill_dir))
+    except FileNotFoundError:
+      return
+    for name in names:
+      if not self.slots.acquire(blocking=False):
+        return
+      path = self.spill_dir / name
+      try:
+        with open(path) as fp:
+          record = json.load(fp)
+        os.remove(path)
+      except FileNotFoundError:
+        self.slots.release()
+        continue
+      self.count("spilled", -1)
+      for function in self.subscriptions.get(record["queue"], []):
+        if function.name == record["function"]:
+          self.count("queued", 1)
+          msg = func.ServiceBusMessage(None)
+          msg.body = record["body"].encode()
+          yield record["queue"], function, msg
+          break
+      else:
+        logger.warn(f"⚠️ No subscriber {record['function']} for spilled message")
+        self.slots.release()
+
+  def count(self, counter, delta):
+    with self.lock:
+      self.counters[counter] += delta
+
+  def busy(self):
+    with self.lock:
+      return self.counters["queued"] + self.counters["in_flight"] > 0
+
+  def room(self):
+    # number of messages that can start running right away
+    with self.lock:
+      return self.pool_size - self.counters["queued"] - self.counters["in_flight"]
+
+  def stats(self):
+    with self.lock:
+      return dict(self.counters)
@@ -0,0 +1,100 @@
+# log of storage changes, shared by all worker processes
+#
+# with a shared storage account (see azure.cluster), every worker keeps its
+# own catalog and tag index. changes made by one worker are appended to this
+# log, in SQLite, and replayed by all other workers when they poll it.
+# applying a change is idempotent, so a new worker replays the recent changes
+# on top of what it loaded from disk. the leader prunes old changes.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import json
+import time
+import sqlite3
+from threading import Lock
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+  id        INTEGER PRIMARY KEY AUTOINCREMENT,
+  origin    INTEGER NOT NULL,
+  kind      TEXT NOT NULL,
+  container TEXT,
+  name      TEXT,
+  data      TEXT,
+  created   REAL NOT NULL
+);
+"""
+
+class EventLog(object):
+  def __init__(self, path):
+    self.path      = path
+    self.retention = float(os.environ.get("AZURE_SHARED_RETENTION", 300))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    self.connect()
+    self.db.executescript(SCHEMA)
+    # start with the changes that might not have reached the disk yet
+    self.last = self.db.execute(
+      "SELECT COALESCE(MIN(id) - 1, (SELECT COALESCE(MAX(id), 0) FROM changes)) "
+      "FROM changes WHERE created > ?",
+      (time.time() - self.retention, )
+    ).fetchone()[0]
+    logger.debug(f"📣 Sharing storage changes through {path}")
+
+  def connect(self):
+    self.lock = Lock()
+    self.db = sqlite3.connect(
+      self.path, check_same_thread=False, isolation_level=None, timeout=30
+    )
+    self.db.execute("PRAGMA journal_mode=WAL")
+
+  def after_fork(self):
+    self.connect()
+
+  def publish(self, kind, container=None, name=None, data=None):
+    with self.lock:
+      self.db.execute(
+        "INSERT INTO changes (origin, kind, container, name, data, created) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (os.getpid(), kind, container, name, json.dumps(data), time.time())
+      )
+
+  def publish_all(self, changes):
+    # (kind, container, name, data) changes, in a single transaction
+    pid, now = os.getpid(), time.time()
+    with self.lock:
+      self.db.execute("BEGIN")
+      try:
+        self.db.executemany(
+          "INSERT INTO changes (origin, kind, container, name, data, created) "
+          "VALUES (?, ?, ?, ?, ?, ?)",
+          [ (pid, kind, container, name, json.dumps(data), now) for kind, container, name, data in changes ]
+        )
+      except:
+        self.db.execute("ROLLBACK")
+        raise
+      self.db.execute("COMMIT")
+
+  def poll(self):
+    # changes made by other processes since the last poll
+    with self.lock:
+      rows = self.db.execute(
+        "SELECT id, origin, kind, container, name, data FROM changes "
+        "WHERE id > ? ORDER BY id",
+        (self.last, )
+      ).fetchall()
+      if rows:
+        self.last = rows[-1][0]
+    pid = os.getpid()
+    return [
+      (kind, container, name, json.loads(data))
+      for _, origin, kind, container, name, data in rows if origin != pid
+    ]
+
+  def prune(self):
+    with self.lock:
+      self.db.execute(
+        "DELETE FROM changes WHERE created < ?", (time.time() - self.retention, )
+      )
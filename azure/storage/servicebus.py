@@ -0,0 +1,173 @@
+# durable service bus queue backed by SQLite, with peek-lock semantics
+#
+# messages are stored per subscribing function. a message is locked while it
+# is being processed, completed (deleted) when the function succeeds, and
+# abandoned when it fails. abandoned messages are retried until they reach the
+# maximum delivery count, at which point they move to the dead-letter
+# sub-queue. writes are committed in groups: a sender waits for the commit
+# that includes its message, but all messages sent while a commit is in
+# progress share the next one, so fsyncs are batched under load. a shared
+# queue is used by several worker processes at once (see azure.cluster), they
+# compete for its messages.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import time
+import sqlite3
+from threading import Thread, Lock, Condition
+
+ACTIVE     = "active"
+DEADLETTER = "deadletter"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+  id             INTEGER PRIMARY KEY AUTOINCREMENT,
+  queue          TEXT NOT NULL,
+  function       TEXT NOT NULL,
+  body           BLOB NOT NULL,
+  state          TEXT NOT NULL DEFAULT 'active',
+  delivery_count INTEGER NOT NULL DEFAULT 0,
+  locked_until   REAL NOT NULL DEFAULT 0,
+  enqueued       REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS available
+  ON messages (state, queue, function, locked_until);
+"""
+
+class DurableQueue(object):
+  def __init__(self, path, shared=False):
+    self.path          = path
+    self.lock_duration = float(os.environ.get("AZURE_SB_LOCK_DURATION", 60))
+    self.max_delivery  = int(os.environ.get("AZURE_SB_MAX_DELIVERY", 10))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    self.connect()
+    self.db.executescript(SCHEMA)
+    # nobody holds a lock after a restart: make everything available again.
+    # other workers sharing the queue might, their locks expire on their own.
+    if not shared:
+      self.db.execute("UPDATE messages SET locked_until = 0 WHERE state = ?", (ACTIVE,))
+    self.start()
+    logger.debug(f"🚌 Durable service bus queue in {path}")
+
+  def connect(self):
+    self.db = sqlite3.connect(
+      self.path, check_same_thread=False, isolation_level=None, timeout=30
+    )
+    self.db.execute("PRAGMA journal_mode=WAL")
+    self.db.execute("PRAGMA synchronous=FULL")
+
+  def start(self):
+    self.lock      = Lock()
+    self.committed = Condition(self.lock)
+    self.written   = 0 # generation of the last write
+    self.synced    = 0 # generation of the last commit
+    self.in_transaction = False
+
+    self.committer = Thread(target=self.run_committer, args=())
+    self.committer.daemon = True
+    self.committer.start()
+
+  def after_fork(self):
+    # a forked child can't use the parent's connection, nor its threads.
+    # uncommitted writes belong to the parent.
+    self.connect()
+    self.start()
+
+  # group commit
+
+  def write(self, sql, args=()):
+    return self.write_all([ (sql, args) ])[0]
+
+  def write_all(self, statements):
+    # statements written together, in the same commit
+    with self.lock:
+      if not self.in_transaction:
+        self.db.execute("BEGIN")
+        self.in_transaction = True
+      cursors = [ self.db.execute(sql, args) for sql, args in statements ]
+      self.written += 1
+      generation = self.written
+      self.committed.notify_all()
+      while self.synced < generation:
+        self.committed.wait()
+      return cursors
+
+  def run_committer(self):
+    with self.lock:
+      while True:
+        while self.synced == self.written:
+          self.committed.wait()
+        self.db.execute("COMMIT")
+        self.in_transaction = False
+        self.synced = self.written
+        self.committed.notify_all()
+
+  def read(self, sql, args=()):
+    with self.lock:
+      return self.db.execute(sql, args).fetchall()
+
+  # messages
+
+  def send(self, queue, function, body, lock=True):
+    # store a message, and optionally lock it for immediate delivery
+    return self.send_all([ (queue, function, body, lock) ])[0]
+
+  def send_all(self, messages):
+    # store (queue, function, body, lock) messages in one go, returns their tokens
+    now = time.time()
+    cursors = self.write_all([
+      ( "INSERT INTO messages (queue, function, body, delivery_count, locked_until, enqueued) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (queue, function, body, 1 if lock else 0, now + self.lock_duration if lock else 0, now) )
+      for queue, function, body, lock in messages
+    ])
+    return [ cursor.lastrowid for cursor in cursors ]
+
+  def receive(self, queue, function, limit=1):
+    # peek-lock up to limit available messages: (lock token, body, delivery count)
+    now = time.time()
+    rows = self.read(
+      "SELECT id, body, delivery_count FROM messages "
+      "WHERE state = ? AND queue = ? AND function = ? AND locked_until < ? "
+      "ORDER BY id LIMIT ?",
+      (ACTIVE, queue, function, now, limit)
+    )
+    received = []
+    for token, body, count in rows:
+      if self.write(
+        "UPDATE messages SET delivery_count = delivery_count + 1, locked_until = ? "
+        "WHERE id = ? AND locked_until < ?",
+        (now + self.lock_duration, token, now)
+      ).rowcount:
+        received.append((token, body, count + 1))
+    return received
+
+  def complete(self, token):
+    self.write("DELETE FROM messages WHERE id = ?", (token,))
+
+  def abandon(self, token):
+    # release the lock, returns False if the message was dead-lettered
+    rows = self.read("SELECT delivery_count FROM messages WHERE id = ?", (token,))
+    if not rows:
+      return False
+    if rows[0][0] >= self.max_delivery:
+      self.write(
+        "UPDATE messages SET state = ?, locked_until = 0 WHERE id = ?",
+        (DEADLETTER, token)
+      )
+      return False
+    self.write("UPDATE messages SET locked_until = 0 WHERE id = ?", (token,))
+    return True
+
+  def dead_letters(self, queue):
+    return self.read(
+      "SELECT id, function, body, delivery_count FROM messages "
+      "WHERE state = ? AND queue = ? ORDER BY id",
+      (DEADLETTER, queue)
+    )
+
+  def count(self, state=ACTIVE):
+    return self.read("SELECT COUNT(*) FROM messages WHERE state = ?", (state,))[0][0]
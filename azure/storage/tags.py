@@ -0,0 +1,405 @@
+# secondary index on blob index tags, per container
+#
+# for every tag, a hash maps values to blob names for equality lookups and a
+# sorted list of (value, name) pairs serves range lookups using bisection.
+# like Azure, tag values are compared as strings.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import re
+import atexit
+import fcntl
+import json
+import time
+import bisect
+from threading import Thread, Lock, RLock, Event
+import operator
+from functools import lru_cache
+
+from azure import cluster
+
+class SortedList(object):
+  # sorted list split in chunks, so inserting and removing only moves the
+  # items of a single chunk, even with millions of items
+
+  LOAD = 500
+
+  def __init__(self):
+    self.chunks = []
+    self.maxes  = []
+
+  def add(self, item):
+    if not self.chunks:
+      self.chunks.append([ item ])
+      self.maxes.append(item)
+      return
+    i = bisect.bisect_left(self.maxes, item)
+    if i == len(self.maxes):
+      i -= 1
+      self.chunks[i].append(item)
+      self.maxes[i] = item
+    else:
+      bisect.insort(self.chunks[i], item)
+    chunk = self.chunks[i]
+    if len(chunk) > 2 * self.LOAD:
+      half = chunk[self.LOAD:]
+      del chunk[self.LOAD:]
+      self.maxes[i] = chunk[-1]
+      self.chunks.insert(i+1, half)
+      self.maxes.insert(i+1, half[-1])
+
+  def remove(self, item):
+    i = bisect.bisect_left(self.maxes, item)
+    if i == len(self.maxes):
+      return
+    chunk = self.chunks[i]
+    j = bisect.bisect_left(chunk, item)
+    if j < len(chunk) and chunk[j] == item:
+      del chunk[j]
+      if chunk:
+        self.maxes[i] = chunk[-1]
+      else:
+        del self.chunks[i]
+        del self.maxes[i]
+
+  def irange(self, lo=None, hi=None):
+    # items with lo <= item < hi, lo and hi are optional
+    i = 0 if lo is None else bisect.bisect_left(self.maxes, lo)
+    for chunk in self.chunks[i:]:
+      start = 0 if lo is None else bisect.bisect_left(chunk, lo)
+      end   = len(chunk) if hi is None else bisect.bisect_left(chunk, hi)
+      yield from chunk[start:end]
+      if end < len(chunk):
+        return
+      lo = None
+
+  def count(self, lo=None, hi=None):
+    total = 0
+    i = 0 if lo is None else bisect.bisect_left(self.maxes, lo)
+    for chunk in self.chunks[i:]:
+      start = 0 if lo is None else bisect.bisect_left(chunk, lo)
+      end   = len(chunk) if hi is None else bisect.bisect_left(chunk, hi)
+      total += end - start
+      if end < len(chunk):
+        break
+      lo = None
+    return total
+
+class TagIndex(object):
+  def __init__(self):
+    self.equal   = {} # tag -> value -> set of names
+    self.ordered = {} # tag -> sorted list of (value, name)
+
+  def add(self, name, tags):
+    for tag, value in tags.items():
+      self.equal.setdefault(tag, {}).setdefault(value, set()).add(name)
+      self.ordered.setdefault(tag, SortedList()).add((value, name))
+
+  def remove(self, name, tags):
+    for tag, value in tags.items():
+      try:
+        names = self.equal[tag][value]
+        names.discard(name)
+        if not names:
+          del self.equal[tag][value]
+        self.ordered[tag].remove((value, name))
+      except KeyError:
+        pass
+
+  def count(self, tag, symbol, value):
+    # number of names matching, used to estimate selectivity
+    if symbol == "=":
+      return len(self.equal.get(tag, {}).get(value, ()))
+    if not tag in self.ordered:
+      return 0
+    return self.ordered[tag].count(*self.range(symbol, value))
+
+  def find(self, tag, symbol, value):
+    if symbol == "=":
+      return set(self.equal.get(tag, {}).get(value, ()))
+    if not tag in self.ordered:
+      return set()
+    return { name for _, name in self.ordered[tag].irange(*self.range(symbol, value)) }
+
+  def range(self, symbol, value):
+    # (value, "") sorts before and (value, MAX) after all pairs with value
+    before = (value, "")
+    after  = (value, "\U0010ffff")
+    return {
+      "<"  : (None,   before),
+      "<=" : (None,   after),
+      ">"  : (after,  None),
+      ">=" : (before, None)
+    }[symbol]
+
+# blob index tag filter expressions
+#
+#   expression := condition ( AND condition )*
+#   condition  := key operator 'value'
+#   key        := "quoted key" | bare_key | @container
+#   operator   := = | < | <= | > | >=
+#
+# each expression is compiled once into a Query, cached by expression string.
+
+OPERATORS = {
+  "="  : operator.eq,
+  "<"  : operator.lt,
+  "<=" : operator.le,
+  ">"  : operator.gt,
+  ">=" : operator.ge
+}
+
+TOKENS = re.compile(r"""
+  \s*(?:
+    (?P<op><=|>=|=|<|>)           |
+    "(?P<key>[^"]*)"              |
+    '(?P<value>(?:[^']|'')*)'     |
+    (?P<word>@?[A-Za-z0-9_+\-./:]+)
+  )
+""", re.VERBOSE)
+
+def tokenize(exp):
+  pos = 0
+  exp = exp.strip()
+  while pos < len(exp):
+    match = TOKENS.match(exp, pos)
+    if not match or match.end() == pos:
+      raise ValueError(f"invalid tag filter expression at {pos}: {exp}")
+    pos = match.end()
+    kind = match.lastgroup
+    text = match.group(kind)
+    if kind == "word" and text.upper() == "AND":
+      yield "and", text
+    elif kind == "word":
+      yield "key", text
+    elif kind == "value":
+      yield kind, text.replace("''", "'")
+    else:
+      yield kind, text
+
+class Query(object):
+  def __init__(self, container, conditions):
+    self.container  = container
+    self.conditions = conditions # list of (tag, symbol, value)
+
+  def matches(self, tags):
+    for tag, symbol, value in self.conditions:
+      if not tag in tags or not OPERATORS[symbol](tags[tag], value):
+        return False
+    return True
+
+  def execute(self, index, tags):
+    # use the most selective condition on the index, filter on the rest
+    if not self.conditions:
+      candidates = list(tags)
+    else:
+      plan = sorted(self.conditions, key=lambda condition: index.count(*condition))
+      candidates = index.find(*plan[0])
+    for name in sorted(candidates):
+      if name in tags and self.matches(tags[name]):
+        yield name
+
+  def __str__(self):
+    conditions = [ f"{tag} {symbol} {value}" for tag, symbol, value in self.conditions ]
+    if self.container:
+      conditions.insert(0, f"@container = {self.container}")
+    return " AND ".join(conditions)
+
+@lru_cache(maxsize=1024)
+def parse(exp):
+  container  = None
+  conditions = []
+  tokens = list(tokenize(exp))
+  while tokens:
+    try:
+      (kind, key), (op, symbol), (value_kind, value) = tokens[:3]
+    except ValueError:
+      raise ValueError(f"incomplete tag filter condition in: {exp}")
+    if kind != "key" or op != "op" or value_kind != "value":
+      raise ValueError(f"invalid tag filter condition {key} {symbol} {value} in: {exp}")
+    tokens = tokens[3:]
+    if tokens:
+      if tokens[0][0] != "and" or len(tokens) == 1:
+        raise ValueError(f"expected AND between conditions in: {exp}")
+      tokens = tokens[1:]
+    if key == "@container":
+      if symbol != "=" or container is not None:
+        raise ValueError(f"only a single @container = condition is allowed in: {exp}")
+      container = value
+    else:
+      conditions.append((key, symbol, value))
+  return Query(container, conditions)
+
+# write-behind persistence of tags
+#
+# tag changes are appended as JSON lines to tags.journal by a background
+# thread. when the journal grows larger than the number of tagged blobs, it is
+# compacted into tags.snapshot, also one JSON line per blob. at startup the
+# snapshot is loaded and the journal(s) replayed on top of it. a tags.json
+# from before the journal is loaded once, when there is no snapshot yet.
+# without a root folder, tags aren't persisted at all. worker processes
+# sharing the storage account (see azure.cluster) all append to the journal,
+# under a file lock, and only the leader compacts it.
+
+class TagJournal(object):
+  def __init__(self, root):
+    self.root     = root
+    if root:
+      self.snapshot = root / "tags.snapshot"
+      self.journal  = root / "tags.journal"
+      self.rotated  = root / "tags.journal.old"
+    self.interval = float(os.environ.get("AZURE_TAGS_FLUSH", .1))
+
+    # lock guards changes to the tags and the buffer, callers changing tags
+    # hold it while doing so, so compaction sees a consistent state
+    self.lock       = RLock()
+    self.write_lock = Lock()
+    self.buffer     = []
+    self.entries    = 0 # in the current journal
+    self.blobs      = 0 # tagged blobs after the last load or compaction
+    self.wakeup     = Event()
+    self.tags       = None
+
+    self.writer     = None # started on first change
+
+  def load(self):
+    if not self.root:
+      self.tags = {}
+      return self.tags
+    tags = self.base()
+    for path in [ self.rotated, self.journal ]:
+      if path.exists():
+        self.entries += self.replay(path, tags)
+    self.blobs = sum(len(blobs) for blobs in tags.values())
+    self.tags  = tags
+    atexit.register(self.flush)
+    return tags
+
+  def base(self):
+    # the tags the journal(s) apply to
+    tags = {}
+    if self.snapshot.exists():
+      self.replay(self.snapshot, tags)
+    else:
+      try:
+        with open(self.root / "tags.json") as fp:
+          tags = json.load(fp)
+          logger.debug(f"🔈 loaded blob tags from tags.json")
+      except FileNotFoundError:
+        pass
+    return tags
+
+  def replay(self, path, tags):
+    count = 0
+    with open(path) as fp:
+      for line in fp:
+        try:
+          container, name, blob_tags = json.loads(line)
+        except ValueError: # a partially written last line
+          continue
+        tags.setdefault(container, {})[name] = blob_tags
+        count += 1
+    return count
+
+  def append(self, container, name, tags):
+    if not self.root:
+      return
+    with self.lock:
+      self.buffer.append((container, name, tags))
+      if self.writer is None:
+        self.writer = Thread(target=self.run_writer, args=())
+        self.writer.daemon = True
+        self.writer.start()
+    self.wakeup.set()
+
+  def replicated(self):
+    # another worker journaled a change, counts towards compaction
+    with self.lock:
+      self.entries += 1
+
+  def after_fork(self):
+    # buffered changes are written by the parent
+    self.lock       = RLock()
+    self.write_lock = Lock()
+    self.buffer     = []
+    self.wakeup     = Event()
+    self.writer     = None
+
+  def flush(self):
+    # write everything appended so far
+    if self.root:
+      self.write()
+
+  def reset(self):
+    # forget all tags, called with write_lock and lock held
+    self.tags.clear()
+    self.buffer  = []
+    self.entries = 0
+    self.blobs   = 0
+    if self.root:
+      for path in [ self.snapshot, self.journal, self.rotated, self.root / "tags.json" ]:
+        if path.exists():
+          os.remove(path)
+
+  def run_writer(self):
+    while True:
+      self.wakeup.wait()
+      time.sleep(self.interval) # gather more changes
+      self.wakeup.clear()
+      self.write()
+
+  def write(self):
+    with self.write_lock:
+      with self.lock:
+        buffer, self.buffer = self.buffer, []
+      if buffer:
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.append_lines("".join(json.dumps(entry) + "\n" for entry in buffer))
+        with self.lock:
+          self.entries += len(buffer)
+      if self.entries > max(self.blobs, 1000) * 2 and cluster.leader.elected():
+        self.compact()
+
+  def append_lines(self, lines):
+    # the lock keeps out other processes appending or rotating the journal.
+    # retry when it was rotated while waiting for the lock.
+    while True:
+      with open(self.journal, "a") as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+          current = os.stat(self.journal).st_ino == os.fstat(fp.fileno()).st_ino
+        except FileNotFoundError:
+          current = False
+        if current:
+          fp.write(lines)
+          return
+
+  def rotate(self):
+    with open(self.journal, "a") as fp:
+      fcntl.flock(fp, fcntl.LOCK_EX)
+      os.replace(self.journal, self.rotated)
+
+  def compact(self):
+    # start a fresh journal and take a consistent copy of all tags. stored tag
+    # dicts are replaced, never changed, so copying the containers suffices.
+    # other workers' changes might not have reached us yet: when shared, merge
+    # the rotated journal into the snapshot on disk instead.
+    with self.lock:
+      self.rotate()
+      self.entries = 0
+      if not cluster.shared:
+        tags = { container : dict(blobs) for container, blobs in self.tags.items() }
+    if cluster.shared:
+      tags = self.base()
+      self.replay(self.rotated, tags)
+    self.blobs = sum(len(blobs) for blobs in tags.values())
+    temp = self.root / "tags.snapshot.tmp"
+    with open(temp, "w") as fp:
+      for container, blobs in tags.items():
+        for name, blob_tags in blobs.items():
+          fp.write(json.dumps((container, name, blob_tags)) + "\n")
+    os.replace(temp, self.snapshot)
+    os.remove(self.rotated)
+    logger.debug(f"🔈 compacted tags of {self.blobs} blobs")
@@ -0,0 +1,378 @@
+# timer triggers: NCRONTAB schedules and a scheduler firing them
+#
+# a schedule has six fields, {second} {minute} {hour} {day} {month}
+# {day-of-week}, each a *, a value, a range (a-b) or a list of those (a,b,c),
+# optionally with a step (*/5, 10-30/10). months and days of the week can be
+# named (JAN, MON), sunday is 0 (or 7). a day must match both the day and
+# day-of-week field. a time span (hh:mm:ss) schedules a fixed interval.
+# schedules are evaluated in UTC, or in WEBSITE_TIME_ZONE.
+#
+# the scheduler keeps a heap of timers by next fire time and sleeps until the
+# first one is due, so idle timers cost nothing. with useMonitor, the last and
+# next occurrence of a timer are recorded in the storage account folder, and a
+# missed occurrence fires at startup, with past_due set. timers follow the
+# (virtual) clock of azure.clock, a fast clock is advanced to the next timer
+# whenever no timer is running and the clock reports no other work.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import json
+import heapq
+import itertools
+from bisect import bisect_left
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from threading import Thread, Lock, Condition
+from concurrent.futures import Future
+
+import azure.functions as func
+from azure.cluster import leader
+from azure.clock import clock
+
+MONTHS = { name : n + 1 for n, name in enumerate(
+  [ "JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC" ]
+)}
+DAYS   = { name : n for n, name in enumerate(
+  [ "SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT" ]
+)}
+
+# name, lowest and highest value, names
+FIELDS = [
+  ("second",      0, 59, {}),
+  ("minute",      0, 59, {}),
+  ("hour",        0, 23, {}),
+  ("day",         1, 31, {}),
+  ("month",       1, 12, MONTHS),
+  ("day-of-week", 0,  7, DAYS)
+]
+
+def parse_field(text, name, lo, hi, names):
+  values = set()
+  for part in text.upper().split(","):
+    part, _, step = part.partition("/")
+    try:
+      step  = int(step) if step else 1
+      if part == "*":
+        start, end = lo, hi
+      elif "-" in part:
+        start, end = [ names[v] if v in names else int(v) for v in part.split("-", 1) ]
+      else:
+        start = names[part] if part in names else int(part)
+        end   = hi if step > 1 else start
+    except ValueError:
+      raise ValueError(f"invalid {name} field: {text}")
+    if step < 1 or not lo <= start <= end <= hi:
+      raise ValueError(f"{name} field out of range: {text}")
+    values.update(range(start, end + 1, step))
+  return values
+
+def time_zone():
+  name = os.environ.get("WEBSITE_TIME_ZONE")
+  if not name:
+    return timezone.utc
+  from zoneinfo import ZoneInfo
+  return ZoneInfo(name)
+
+class CronSchedule(object):
+  def __init__(self, expression):
+    fields = expression.split()
+    if len(fields) != 6:
+      raise ValueError(f"expected 6 fields, got {len(fields)}: {expression}")
+    self.expression = expression
+    self.tz = time_zone()
+    seconds, minutes, hours, days, months, weekdays = [
+      parse_field(text, *field) for text, field in zip(fields, FIELDS)
+    ]
+    if 7 in weekdays:
+      weekdays = (weekdays - { 7 }) | { 0 }
+    self.seconds  = sorted(seconds)
+    self.minutes  = sorted(minutes)
+    self.hours    = sorted(hours)
+    self.days     = days
+    self.months   = sorted(months)
+    self.weekdays = weekdays
+
+  def next(self, after):
+    # first occurrence strictly after a given (aware) datetime, or None. the
+    # search works on local wall time and skips ahead field by field.
+    t = after.astimezone(self.tz).replace(tzinfo=None, microsecond=0) + timedelta(seconds=1)
+    limit = t.year + 28 # leap days on a given day of the week repeat every 28 years
+    while t.year <= limit:
+      if not t.month in self.months:
+        i = bisect_left(self.months, t.month)
+        if i == len(self.months):
+          t = datetime(t.year + 1, self.months[0], 1)
+        else:
+          t = datetime(t.year, self.months[i], 1)
+        continue
+      if not t.day in self.days or not (t.weekday() + 1) % 7 in self.weekdays:
+        t = datetime(t.year, t.month, t.day) + timedelta(days=1)
+        continue
+      if not t.hour in self.hours:
+        i = bisect_left(self.hours, t.hour)
+        if i == len(self.hours):
+          t = datetime(t.year, t.month, t.day) + timedelta(days=1)
+        else:
+          t = t.replace(hour=self.hours[i], minute=0, second=0)
+        continue
+      if not t.minute in self.minutes:
+        i = bisect_left(self.minutes, t.minute)
+        if i == len(self.minutes):
+          t = t.replace(minute=0, second=0) + timedelta(hours=1)
+        else:
+          t = t.replace(minute=self.minutes[i], second=0)
+        continue
+      if not t.second in self.seconds:
+        i = bisect_left(self.seconds, t.second)
+        if i == len(self.seconds):
+          t = t.replace(second=0) + timedelta(minutes=1)
+        else:
+          t = t.replace(second=self.seconds[i])
+        continue
+      return t.replace(tzinfo=self.tz)
+    return None
+
+  def __str__(self):
+    return self.expression
+
+class IntervalSchedule(object):
+  def __init__(self, expression):
+    try:
+      hours, minutes, seconds = [ int(v) for v in expression.split(":") ]
+    except ValueError:
+      raise ValueError(f"invalid time span: {expression}")
+    self.expression = expression
+    self.interval   = timedelta(hours=hours, minutes=minutes, seconds=seconds)
+    if self.interval <= timedelta(0):
+      raise ValueError(f"time span must be positive: {expression}")
+
+  def next(self, after):
+    return after + self.interval
+
+  def __str__(self):
+    return f"every {self.expression}"
+
+def parse(expression):
+  if ":" in expression and len(expression.split()) == 1:
+    return IntervalSchedule(expression)
+  return CronSchedule(expression)
+
+class Timer(object):
+  def __init__(self, name, expression, function, run_on_startup=False, use_monitor=None):
+    self.name           = name
+    self.schedule       = parse(expression)
+    self.function       = function
+    self.run_on_startup = run_on_startup
+    self.running        = False
+    if use_monitor is None:
+      # like Azure, monitor schedules that fire at most once a minute
+      first = self.schedule.next(clock.now())
+      then  = first and self.schedule.next(first)
+      use_monitor = bool(then) and then - first >= timedelta(minutes=1)
+    self.use_monitor = use_monitor
+
+class Scheduler(object):
+  def __init__(self):
+    self.threads = int(os.environ.get("AZURE_TIMER_THREADS", 10))
+    # fired more than tolerance seconds late, a timer is past due
+    self.tolerance = float(os.environ.get("AZURE_TIMER_TOLERANCE", 1))
+    self.status_dir = Path(os.environ.get("AZURE_SA", "local_blob_storage")) / ".timers"
+    self.timers = []
+    self.reset()
+
+  def reset(self):
+    self.lock     = Lock()
+    self.changed  = Condition(self.lock)
+    self.heap     = [] # (due timestamp, sequence, timer, past due)
+    self.sequence = itertools.count()
+    self.thread   = None
+    self.executor = None
+    self.active   = 0  # running timers
+
+  def after_fork(self):
+    # reschedule all timers in the child, the parent's firings stay there
+    timers = self.timers
+    self.timers = []
+    self.reset()
+    for timer in timers:
+      timer.running = False
+      self.add(timer, startup=False)
+
+  def now(self):
+    return clock.now()
+
+  def wake(self):
+    with self.lock:
+      self.changed.notify_all()
+
+  def idle(self):
+    # called with lock held
+    return self.active == 0 and clock.idle()
+
+  def fast_forward(self):
+    # advance a virtual clock to the next occurrence of any timer, returns it
+    with self.lock:
+      if not self.heap:
+        return None
+      due = self.heap[0][0]
+    clock.advance(due - clock.time())
+    return datetime.fromtimestamp(due, timezone.utc)
+
+  def run_until(self, when):
+    # advance a virtual clock to a given time, firing all timers on the way,
+    # one occurrence at a time, each after the previous one completed
+    while True:
+      with self.lock:
+        while self.heap and self.heap[0][0] <= clock.time() or not self.idle():
+          self.changed.wait(.01)
+        due = self.heap[0][0] if self.heap else None
+      if due is None or due > when.timestamp():
+        clock.advance_to(when)
+        return
+      clock.advance(due - clock.time())
+
+  def add(self, timer, startup=True):
+    now  = self.now()
+    due  = timer.schedule.next(now)
+    past = False
+    if startup and timer.use_monitor:
+      status = self.status(timer)
+      if status and status.get("Next") and datetime.fromisoformat(status["Next"]) < now:
+        logger.info(f"⏰ {timer.name} missed its occurrence at {status['Next']}")
+        due, past = now, True
+    if startup and timer.run_on_startup:
+      due = now
+    self.timers.append(timer)
+    if due is None:
+      logger.warn(f"⚠️ {timer.name} never fires: {timer.schedule}")
+      return
+    self.push(timer, due, past)
+    if timer.use_monitor:
+      self.record(timer, None, due)
+
+  def push(self, timer, due, past_due=False):
+    with self.lock:
+      heapq.heappush(self.heap, (due.timestamp(), next(self.sequence), timer, past_due))
+      if self.thread is None:
+        self.thread = Thread(target=self.run, args=())
+        self.thread.daemon = True
+        self.thread.start()
+      self.changed.notify_all()
+
+  def run(self):
+    logger.debug("⏰ Started timer scheduler thread.")
+    with self.lock:
+      while True:
+        if not self.heap:
+          self.changed.wait()
+          continue
+        now   = clock.time()
+        delay = self.heap[0][0] - now
+        if delay > 0 and clock.fast and self.idle():
+          self.lock.release()
+          try:
+            clock.advance(delay)
+          finally:
+            self.lock.acquire()
+          continue
+        if delay > 0:
+          self.changed.wait(delay)
+          continue
+        # all timers that are due fire first, then they are rescheduled
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+          due.append(heapq.heappop(self.heap))
+        self.active += 1 # firing counts as running
+        self.lock.release()
+        try:
+          fire = leader.elected() # when shared, only the leader fires timers
+          for scheduled, _, timer, past_due in due:
+            if fire:
+              self.fire(timer, scheduled, past_due)
+          for scheduled, _, timer, _ in due:
+            self.reschedule(timer, scheduled, fire)
+        finally:
+          self.lock.acquire()
+          self.active -= 1
+          self.changed.notify_all()
+
+  def fire(self, timer, scheduled, past_due):
+    if timer.running:
+      logger.warn(f"⚠️ {timer.name} is still running, skipping this occurrence")
+      return
+    past_due = past_due or clock.time() - scheduled > self.tolerance
+    # like Azure, the status holds the previous and this occurrence
+    status   = self.status(timer) if timer.use_monitor else None
+    request  = func.TimerRequest(past_due=past_due, schedule_status=status)
+    timer.running = True
+    with self.lock:
+      self.active += 1
+    if getattr(timer.function, "is_async", False):
+      # runs on the event loop of the host, not on one of our threads
+      future = timer.function.submit(request)
+      future.add_done_callback(lambda future: self.invoke(timer, future))
+      return
+    if self.executor is None:
+      from concurrent.futures import ThreadPoolExecutor
+      self.executor = ThreadPoolExecutor(
+        max_workers=self.threads, thread_name_prefix="timer"
+      )
+    try:
+      self.executor.submit(self.invoke, timer, request)
+    except RuntimeError: # shutting down
+      timer.running = False
+      with self.lock:
+        self.active -= 1
+
+  def reschedule(self, timer, scheduled, fired):
+    now = self.now()
+    due = timer.schedule.next(max(now, datetime.fromtimestamp(scheduled, timezone.utc)))
+    if due:
+      self.push(timer, due)
+    if fired and timer.use_monitor:
+      self.record(timer, now, due)
+
+  def invoke(self, timer, request):
+    # runs a timer function, or takes the outcome of an async one from its future
+    try:
+      if isinstance(request, Future):
+        request.result()
+      else:
+        timer.function(request)
+    except Exception as e:
+      logger.error(f"🚨  While executing function {timer.name}...")
+      logger.exception(e)
+    finally:
+      timer.running = False
+      with self.lock:
+        self.active -= 1
+        self.changed.notify_all()
+
+  # monitoring
+
+  def status(self, timer):
+    try:
+      with open(self.status_dir / f"{timer.name}.json") as fp:
+        return json.load(fp)
+    except (FileNotFoundError, ValueError):
+      return None
+
+  def record(self, timer, last, due):
+    previous = self.status(timer) or {}
+    status = {
+      "Last"        : last.isoformat() if last else previous.get("Last"),
+      "Next"        : due.isoformat() if due else None,
+      "LastUpdated" : self.now().isoformat()
+    }
+    self.status_dir.mkdir(parents=True, exist_ok=True)
+    temp = self.status_dir / f"{timer.name}.json.tmp"
+    with open(temp, "w") as fp:
+      json.dump(status, fp)
+    os.replace(temp, self.status_dir / f"{timer.name}.json")
+    return status
+
+scheduler = Scheduler()
+clock.on_change(scheduler.wake)
+os.register_at_fork(after_in_child=scheduler.after_fork)
@@ -0,0 +1,193 @@
+# process pool for running CPU-bound functions outside of the GIL
+#
+# functions opt in by setting "execution" : "process" in their
+# function.local.json. the pool is created on first use and each worker
+# process imports the modules of all opted-in functions once, when it starts.
+# only the module name and the (picklable) arguments are sent to the workers.
+#
+# the storage account lives in the parent: workers send their storage calls
+# to it over a connection, so blobs they write are listed, their tags indexed
+# and events raised, as for any other function. blobs they download are
+# copied over in full.
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import sys
+import asyncio
+import importlib
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+from concurrent.futures import ProcessPoolExecutor
+from threading import Thread, Lock
+
+import azure.functions as func
+from azure.clock import clock
+from azure.storage.blob import StorageAccount, StorageStreamDownloader, MappedStreamDownloader, chunked
+from azure.storage.backends import MemoryBlob
+
+# parent side
+
+modules  = {} # module name -> sys.path entry to import it from
+executor = None
+listener = None # for the storage calls of the workers
+lock     = Lock()
+
+def after_fork():
+  # the pool belongs to the parent, a forked child starts its own when needed
+  global executor, listener, lock
+  executor = None
+  listener = None
+  lock     = Lock()
+
+os.register_at_fork(after_in_child=after_fork)
+
+def register(name, path):
+  modules[name] = path
+
+def get_executor():
+  global executor, listener
+  with lock:
+    if executor is None:
+      listener = Listener(authkey=multiprocessing.current_process().authkey)
+      thread = Thread(target=serve, args=(listener, ))
+      thread.daemon = True
+      thread.start()
+      processes = int(os.environ.get("AZURE_FUNC_PROCESSES", os.cpu_count() or 1))
+      logger.info(f"⚙️  Starting {processes} function worker processes")
+      # spawn fresh interpreters: forking a process with running notifier
+      # and scheduler threads isn't safe
+      executor = ProcessPoolExecutor(
+        max_workers = processes,
+        mp_context  = multiprocessing.get_context("spawn"),
+        initializer = preload,
+        initargs    = (dict(modules), listener.address)
+      )
+  return executor
+
+def serve(listener):
+  while True:
+    try:
+      connection = listener.accept()
+    except multiprocessing.AuthenticationError:
+      continue
+    except OSError:
+      return
+    thread = Thread(target=handle, args=(connection, ))
+    thread.daemon = True
+    thread.start()
+
+# the storage calls workers can make
+CALLS = {
+  "add", "tag", "get_tags", "exists", "properties", "send", "list", "find_blobs_by_tags", "get"
+}
+
+def call(name, args):
+  # makes a storage call of a worker, returns what to send back
+  if not name in CALLS:
+    raise AttributeError(f"{name} can't be called from a worker process")
+  if name == "get": # the content, the downloader can't be sent
+    container, filename, offset, length = args
+    return StorageAccount.get(container, filename, offset, length, mapped=False).readall()
+  result = getattr(StorageAccount, name)(*args)
+  return list(result) if name in ("list", "find_blobs_by_tags") else result
+
+def handle(connection):
+  # serves the storage calls of a worker, until it goes away
+  with connection:
+    while True:
+      try:
+        name, args = connection.recv()
+      except (EOFError, OSError):
+        return
+      try:
+        connection.send((True, call(name, args)))
+      except Exception as e:
+        connection.send((False, e))
+
+def run(function, kwargs):
+  result, outputs = get_executor().submit(
+    invoke, function.name, clock.offset, kwargs
+  ).result()
+  # hand the values of output bindings back, they are written in this process,
+  # so events are raised here
+  for name, value in outputs.items():
+    kwargs[name].set(value)
+  return result
+
+# worker side
+
+functions = {}
+
+class RemoteStorage(object):
+  # stands in for the storage account in a worker, calling the parent's
+  def __init__(self, address):
+    self.connection = Client(address, authkey=multiprocessing.current_process().authkey)
+    self.lock       = Lock() # functions may use threads of their own
+
+  def call(self, name, *args):
+    with self.lock:
+      self.connection.send((name, args))
+      ok, result = self.connection.recv()
+    if not ok:
+      raise result
+    return result
+
+  def add(self, container, filename, data):
+    self.call("add", container, filename, [ bytes(chunk) for chunk in chunked(data) ])
+
+  def tag(self, container, filename, tags):
+    self.call("tag", container, filename, tags)
+
+  def get_tags(self, container, filename):
+    return self.call("get_tags", container, filename)
+
+  def exists(self, container, filename):
+    return self.call("exists", container, filename)
+
+  def properties(self, container, filename):
+    return self.call("properties", container, filename)
+
+  def send(self, queue, body):
+    self.call("send", queue, body)
+
+  def list(self, container, prefix=None, start_after=None, limit=None):
+    return iter(self.call("list", container, prefix, start_after, limit))
+
+  def find_blobs_by_tags(self, exp):
+    return iter(self.call("find_blobs_by_tags", exp))
+
+  def get(self, container, filename, offset=None, length=None, mapped=None):
+    data = self.call("get", container, filename, offset, length)
+    if mapped is None:
+      mapped = os.environ.get("AZURE_BLOB_MMAP", "0") == "1"
+    downloader = MappedStreamDownloader if mapped else StorageStreamDownloader
+    return downloader(container, filename, MemoryBlob(data))
+
+def preload(modules, address):
+  logging.basicConfig(
+    level  = os.environ.get("LOG_LEVEL") or "DEBUG",
+    format = os.environ.get("LOGGER_FORMAT", "%(message)s")
+  )
+  StorageAccount.use(RemoteStorage(address))
+  for name, path in modules.items():
+    if not path in sys.path:
+      sys.path.append(path)
+    load(name)
+
+def load(name):
+  module = importlib.import_module(name)
+  clock.patch(module)
+  functions[name] = getattr(module, "main")
+
+def invoke(name, offset, kwargs):
+  clock.offset = offset # follow the parent's (virtual) clock
+  if not name in functions: # registered after this worker was started
+    load(name)
+  result = functions[name](**kwargs)
+  if asyncio.iscoroutine(result):
+    result = asyncio.run(result)
+  return result, {
+    k : arg.get() for k, arg in kwargs.items() if isinstance(arg, func.Out)
+  }
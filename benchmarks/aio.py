@@ -0,0 +1,46 @@
+# throughput of concurrent uploads of async iterables with the asyncio SDK,
+# with more uploads running at the same time than threads in its pool
+#
+#   % python benchmarks/aio.py [uploads] [threads]
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import tempfile
+
+# import azure from this checkout, wherever this is run from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+uploads = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+CHUNKS = 16
+
+logging.basicConfig(level=logging.ERROR) # no storage queues, no events
+
+async def chunks():
+  for _ in range(CHUNKS):
+    await asyncio.sleep(0) # let the other uploads run
+    yield b"x" * 64 * 1024
+
+async def main():
+  async with BlobServiceClient.from_connection_string("dummy") as client:
+    container = client.get_container_client("bench")
+    start = time.perf_counter()
+    await asyncio.wait_for(asyncio.gather(*[
+      container.get_blob_client(f"blob-{n}").upload_blob(chunks()) for n in range(uploads)
+    ]), timeout=60)
+    elapsed = time.perf_counter() - start
+    sizes = [ len(await (await container.download_blob(f"blob-{n}")).readall()) for n in range(uploads) ]
+    assert sizes == [ CHUNKS * 64 * 1024 ] * uploads, "incomplete uploads"
+  print(f"  {uploads / elapsed:8.0f} uploads/s")
+
+with tempfile.TemporaryDirectory() as root:
+  os.environ["AZURE_SA"]               = root
+  os.environ["AZURE_BLOB_AIO_THREADS"] = str(threads)
+  from azure.storage.blob.aio import BlobServiceClient
+
+  print(f"{uploads} concurrent uploads of {CHUNKS} chunks of 64KB, {threads} threads")
+  asyncio.run(main())
@@ -0,0 +1,60 @@
+# concurrency of the ASGI entry point: concurrent requests on a function that
+# waits half a second, async and sync, as an ASGI server would make them
+#
+#   % python benchmarks/asgi.py [requests]
+
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+
+# import azure from this checkout, wherever this is run from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+FUNCTIONS = {
+  "waiting_async" : "import asyncio\nasync def main(req):\n  await asyncio.sleep(.5)\n  return 'ok'\n",
+  "waiting_sync"  : "import time\ndef main(req):\n  time.sleep(.5)\n  return 'ok'\n"
+}
+
+async def get(server, path):
+  messages = [ { "type" : "http.request", "body" : b"" } ]
+  sent     = []
+  async def receive():
+    return messages.pop(0)
+  async def send(message):
+    sent.append(message)
+  await server({
+    "type" : "http", "method" : "GET", "path" : path, "query_string" : b"",
+    "headers" : [ (b"host", b"localhost") ]
+  }, receive, send)
+  return sent[0]["status"]
+
+async def measure(server, name):
+  start    = time.perf_counter()
+  statuses = await asyncio.gather(*[ get(server, f"/api/{name}") for _ in range(requests) ])
+  assert set(statuses) == { 200 }
+  print(f"  {name:13} : {time.perf_counter() - start:6.2f}s")
+
+with tempfile.TemporaryDirectory() as root:
+  for name, code in FUNCTIONS.items():
+    os.makedirs(os.path.join(root, "bench", name))
+    with open(os.path.join(root, "bench", name, "__init__.py"), "w") as fp:
+      fp.write(code)
+    with open(os.path.join(root, "bench", name, "function.json"), "w") as fp:
+      json.dump({ "bindings" : [
+        { "type" : "httpTrigger", "direction" : "in", "name" : "req", "route" : name }
+      ]}, fp)
+  os.chdir(root)
+  sys.path.insert(0, root)
+  os.environ["AZURE_SA"]  = os.path.join(root, "sa")
+  os.environ["FUNC_APP"]  = "bench"
+  os.environ["LOG_LEVEL"] = "WARNING"
+  from azure.asgi import server
+
+  print(f"{requests} concurrent requests, waiting .5s each, {server.executor._max_workers} threads")
+  asyncio.run(measure(server, "waiting_async"))
+  asyncio.run(measure(server, "waiting_sync"))
@@ -0,0 +1,62 @@
+# throughput of small blob writes, reads and listings for each storage backend
+#
+#   % python benchmarks/backends.py [blobs] [size]
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+# import azure from this checkout, wherever this is run from, also in the children
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def child(blobs, size):
+  from azure.storage.blob import BlobServiceClient
+
+  container = BlobServiceClient.from_connection_string("dummy").get_container_client("bench")
+  data = os.urandom(size)
+  results = []
+
+  start = time.perf_counter()
+  for n in range(blobs):
+    container.get_blob_client(f"blob-{n:08d}").upload_blob(data)
+  results.append(blobs / (time.perf_counter() - start))
+
+  start = time.perf_counter()
+  for n in range(blobs):
+    container.download_blob(f"blob-{n:08d}").readall()
+  results.append(blobs / (time.perf_counter() - start))
+
+  start = time.perf_counter()
+  listed = 0
+  for n in range(0, blobs, 100):
+    listed += len(list(container.list_blobs(name_starts_with=f"blob-{n // 100:06d}")))
+  results.append(listed / (time.perf_counter() - start))
+
+  print(" ".join(str(result) for result in results))
+
+def run(backend, blobs, size):
+  with tempfile.TemporaryDirectory() as root:
+    env = dict(os.environ,
+      AZURE_SA         = os.path.join(root, "sa"),
+      AZURE_SA_BACKEND = backend,
+      LOG_LEVEL        = "ERROR"
+    )
+    result = subprocess.run(
+      [ sys.executable, os.path.abspath(__file__), "child", str(blobs), str(size) ],
+      cwd=root, env=env, capture_output=True, text=True, check=True
+    )
+    return [ float(value) for value in result.stdout.strip().split("\n")[-1].split() ]
+
+if __name__ == "__main__":
+  if sys.argv[1:2] == [ "child" ]:
+    child(int(sys.argv[2]), int(sys.argv[3]))
+  else:
+    blobs = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    size  = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    print(f"{blobs} blobs of {size} bytes, in blobs/s")
+    print(f"  {'backend':10} {'write':>10} {'read':>10} {'list':>10}")
+    for backend in [ "filesystem", "memory", "sqlite" ]:
+      write, read, listing = run(backend, blobs, size)
+      print(f"  {backend:10} {write:10.0f} {read:10.0f} {listing:10.0f}")
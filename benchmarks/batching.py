@@ -0,0 +1,81 @@
+# requests per second on a function writing a tagged blob per request, with a
+# shared storage account (AZURE_SHARED) and the SQLite backend, from concurrent
+# clients, with and without batching its writes
+#
+#   % python benchmarks/batching.py [requests] [clients]
+
+import os
+import sys
+import json
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# import azure from this checkout, wherever this is run from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+clients  = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+
+CREATE = """
+from azure.storage.blob import BlobServiceClient
+container = BlobServiceClient.from_connection_string("dummy").get_container_client("todo")
+def main(req):
+  container.get_blob_client(req.params["filename"]).upload_blob(b"content", tags={ "tts" : "0" })
+  return "ok"
+"""
+
+HANDLE = """
+def main(msg):
+  pass
+"""
+
+with tempfile.TemporaryDirectory() as root:
+  def function(name, code, bindings):
+    os.makedirs(os.path.join(root, "bench", name))
+    with open(os.path.join(root, "bench", name, "__init__.py"), "w") as fp:
+      fp.write(code)
+    with open(os.path.join(root, "bench", name, "function.json"), "w") as fp:
+      json.dump({ "bindings" : bindings }, fp)
+
+  function("create", CREATE, [
+    { "type" : "httpTrigger", "direction" : "in", "name" : "req", "route" : "create" }
+  ])
+  function("handle", HANDLE, [
+    { "type" : "serviceBusTrigger", "direction" : "in", "name" : "msg", "queueName" : "todo-events" }
+  ])
+  with open(os.path.join(root, "storage-queues.json"), "w") as fp:
+    json.dump({ "todo" : "todo-events" }, fp)
+
+  os.chdir(root)
+  sys.path.insert(0, root)
+  os.environ["AZURE_SA"]         = os.path.join(root, "sa")
+  os.environ["AZURE_SA_BACKEND"] = "sqlite"
+  os.environ["AZURE_SHARED"]     = "1"
+  os.environ["LOG_LEVEL"]        = "WARNING"
+  from werkzeug.test import EnvironBuilder
+  from azure.routes import RouteTable
+  from azure.func_app import HttpDispatcher, create_app
+  from azure.batching import Batcher
+  from azure.storage.blob import StorageAccount
+
+  routes = RouteTable()
+  create_app("bench", routes)
+  dispatcher = HttpDispatcher(routes, None)
+  create     = routes.match("GET", "/create")[0]
+
+  def get(n):
+    environ = EnvironBuilder(f"/api/create?filename={n}.txt").get_environ()
+    b"".join(dispatcher(environ, lambda status, headers: None))
+
+  print(f"{requests} requests from {clients} clients")
+  with ThreadPoolExecutor(clients) as pool:
+    for batched in [ False, True ]:
+      create.batcher = Batcher(create.name, {}) if batched else None
+      start = time.perf_counter()
+      list(pool.map(get, range(requests)))
+      elapsed = time.perf_counter() - start
+      print(f"  {'batched' if batched else 'unbatched':9} : {requests / elapsed:8.0f} req/s")
+
+  while StorageAccount.busy(): # let the events be handled before cleaning up
+    time.sleep(.1)
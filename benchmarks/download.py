@@ -0,0 +1,38 @@
+# memory and latency of reading a blob with readall(), copying vs mapped
+#
+#   % python benchmarks/download.py [megabytes] [rounds]
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+# import azure from this checkout, wherever this is run from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+size   = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+with tempfile.TemporaryDirectory() as root:
+  os.environ["AZURE_SA"] = root
+  from azure.storage.blob import BlobServiceClient
+
+  container = BlobServiceClient.from_connection_string("dummy").get_container_client("bench")
+  container.get_blob_client("blob").upload_blob(
+    os.urandom(1024 * 1024) for _ in range(size)
+  )
+
+  print(f"readall() of a {size}MB blob, {rounds} rounds")
+  for mapped in [ False, True ]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(rounds):
+      data = container.download_blob("blob", mapped=mapped).readall()
+      checksum = data[len(data) // 2]
+      del data
+    latency = (time.perf_counter() - start) / rounds
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {'mapped' if mapped else 'copying':7} : {latency * 1000:8.2f} ms, "
+          f"peak allocated {peak / 1024 / 1024:8.2f} MB")
@@ -0,0 +1,59 @@
+# requests per second on the hello/v1/ endpoint of the hello_service, and the
+# per-request overhead of invoking an HTTP triggered function, measured with
+# a function that does nothing, and of one rendering a JSON document, as is
+# and with its responses cached
+#
+#   % python benchmarks/invocation.py [requests]
+
+import os
+import sys
+import json
+import time
+import tempfile
+
+# import azure, and find services/, from this checkout, wherever this is run from
+checkout = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, checkout)
+os.chdir(checkout)
+
+requests = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+with tempfile.TemporaryDirectory() as root:
+  os.environ["AZURE_SA"]         = root
+  os.environ["AZURE_SA_BACKEND"] = "memory"
+  os.environ["FUNC_APP"]         = "services/hello_service"
+  os.environ["LOG_LEVEL"]        = "WARNING"
+  import azure.app
+  from azure.func_app import Function, HttpDispatcher
+  from azure.routes import RouteTable
+  from azure.cache import ResponseCache
+  from werkzeug.test import EnvironBuilder
+
+  client = azure.app.server.test_client()
+  start = time.perf_counter()
+  for n in range(requests):
+    client.get(f"/api/hello/v1/?name=n{n}")
+  print(f"{requests} requests on hello/v1/ : {requests / (time.perf_counter() - start):8.0f} req/s")
+
+  # the hello/v1/ function, doing nothing, dispatched from a table of its own
+  routes   = RouteTable()
+  function = Function("services/hello_service", "hello_function", routes)
+  function.function = lambda req, outputblob: "ok"
+  dispatcher = HttpDispatcher(routes, None)
+  environ    = EnvironBuilder("/api/hello/v1/?name=x").get_environ()
+  start = time.perf_counter()
+  for n in range(requests):
+    b"".join(dispatcher(dict(environ), lambda status, headers: None))
+  elapsed = time.perf_counter() - start
+  print(f"invocation overhead : {elapsed / requests * 1e6:8.1f} us/request")
+
+  function.function = lambda req, outputblob: json.dumps([
+    { "id" : n, "name" : f"item {n}", "tags" : [ "a", "b", "c" ] } for n in range(1000)
+  ])
+  for cached in [ False, True ]:
+    function.cache = ResponseCache(function.name, { "ttl" : 60 }) if cached else None
+    start = time.perf_counter()
+    for n in range(requests):
+      b"".join(dispatcher(dict(environ), lambda status, headers: None))
+    elapsed = time.perf_counter() - start
+    print(f"{'cached' if cached else 'rendering':10}          : {elapsed / requests * 1e6:8.1f} us/request")
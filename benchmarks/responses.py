@@ -0,0 +1,60 @@
+# memory and latency of serving a blob from an HTTP function through the WSGI
+# dispatcher, returning its content as bytes vs returning the downloader
+#
+#   % python benchmarks/responses.py [megabytes] [rounds]
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+# import azure from this checkout, wherever this is run from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.test import EnvironBuilder
+
+size   = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+with tempfile.TemporaryDirectory() as root:
+  os.environ["AZURE_SA"] = root
+  import azure.functions as func
+  from azure.storage.blob import BlobServiceClient
+  from azure.routes import RouteTable
+  from azure.func_app import HttpDispatcher
+
+  container = BlobServiceClient.from_connection_string("dummy").get_container_client("bench")
+  container.get_blob_client("blob").upload_blob(
+    os.urandom(1024 * 1024) for _ in range(size)
+  )
+
+  class Download(object):
+    def __init__(self, name, body):
+      self.name    = name
+      self.body    = body
+      self.cache   = None
+      self.batcher = None
+    def __call__(self, req):
+      return func.HttpResponse(self.body(container.download_blob("blob")))
+
+  routes = RouteTable()
+  routes.add("buffered", None, Download("buffered", lambda downloader: downloader.readall()))
+  routes.add("streamed", None, Download("streamed", lambda downloader: downloader))
+  dispatcher = HttpDispatcher(routes, None)
+  ignore     = lambda status, headers: None
+
+  print(f"serving a {size}MB blob, {rounds} rounds")
+  for name in [ "buffered", "streamed" ]:
+    environ = EnvironBuilder(f"/api/{name}").get_environ()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(rounds):
+      body = dispatcher(dict(environ), ignore)
+      sent = sum(len(chunk) for chunk in body) # as a server would send it
+      if hasattr(body, "close"):
+        body.close()
+    latency = (time.perf_counter() - start) / rounds
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {name:8} : {latency * 1000:8.2f} ms, peak allocated {peak / 1024 / 1024:8.2f} MB")
@@ -0,0 +1,79 @@
+# routing throughput with 500 HTTP triggered functions: matching paths against
+# the route table, compared to the werkzeug URL map Flask uses, and requests
+# per second through the WSGI dispatcher, compared to Flask, with functions
+# that do nothing
+#
+#   % python benchmarks/routes.py [requests]
+
+import os
+import sys
+import time
+import random
+
+# import azure from this checkout, wherever this is run from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from werkzeug.routing import Map, Rule
+from werkzeug.test import EnvironBuilder
+
+from azure.routes import RouteTable
+from azure.func_app import HttpDispatcher
+
+FUNCTIONS = 500
+requests  = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+# three kinds of routes, with the equivalent werkzeug rule
+def route(n):
+  return [
+    (f"svc{n}/items/{{id:int}}",                     f"/api/svc{n}/items/<int:id>"),
+    (f"svc{n}/users/{{name:alpha}}/files/{{*path}}", f"/api/svc{n}/users/<name>/files/<path:path>"),
+    (f"svc{n}/status",                               f"/api/svc{n}/status")
+  ][n % 3]
+
+def path(n):
+  return [
+    f"/api/svc{n}/items/42",
+    f"/api/svc{n}/users/alice/files/2022/report.pdf",
+    f"/api/svc{n}/status"
+  ][n % 3]
+
+class Noop(object):
+  def __init__(self, n):
+    self.name    = f"svc{n}"
+    self.cache   = None
+    self.batcher = None
+  def __call__(self, req):
+    return "ok"
+
+random.seed(1)
+paths = [ path(random.randrange(FUNCTIONS)) for _ in range(requests) ]
+
+routes = RouteTable()
+rules  = Map()
+flask  = Flask(__name__)
+for n in range(FUNCTIONS):
+  template, rule = route(n)
+  routes.add(template, [ "get" ], Noop(n))
+  rules.add(Rule(rule, endpoint=n, methods=[ "GET" ]))
+  flask.add_url_rule(rule, f"f{n}", lambda **kwargs: "ok")
+
+def measure(name, f, items):
+  start = time.perf_counter()
+  for item in items:
+    f(item)
+  print(f"  {name:22} : {len(items) / (time.perf_counter() - start):10.0f} /s")
+
+print(f"{requests} requests over {FUNCTIONS} functions")
+adapter = rules.bind("localhost")
+measure("route table match", lambda p: routes.match("GET", p[4:]), paths)
+measure("werkzeug map match", lambda p: adapter.match(p, "GET"), paths)
+
+environs   = [ EnvironBuilder(p).get_environ() for p in paths ]
+dispatcher = HttpDispatcher(routes, None)
+ignore     = lambda status, headers: None
+measure("dispatcher requests", lambda e: b"".join(dispatcher(dict(e), ignore)), environs)
+measure("flask requests", lambda e: b"".join(flask.wsgi_app(dict(e), ignore)), environs)
+
+environs = [ EnvironBuilder(p, method="PUT").get_environ() for p in paths[:requests // 10] ]
+measure("dispatcher 405s", lambda e: b"".join(dispatcher(dict(e), ignore)), environs)
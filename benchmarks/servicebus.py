@@ -0,0 +1,67 @@
+# compare end-to-end throughput of the in-memory and durable service bus:
+# blob events are raised from a number of threads and dispatched to a
+# subscribed function that does nothing.
+#
+#   % python benchmarks/servicebus.py [messages] [threads]
+
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+from threading import Thread, Event
+
+# import azure from this checkout, wherever this is run from, also in the children
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def child(messages, threads):
+  from azure.storage.blob import StorageAccount
+
+  done  = Event()
+  calls = []
+  class Function(object):
+    name = "noop"
+    def __call__(self, msg):
+      calls.append(1)
+      if len(calls) == messages:
+        done.set()
+
+  StorageAccount.subscribe("queue", Function())
+
+  def producer(n):
+    for _ in range(n):
+      StorageAccount.notify("container", "blob.txt", 1024)
+
+  per_thread = messages // threads
+  workers = [ Thread(target=producer, args=(per_thread,)) for _ in range(threads) ]
+  start = time.perf_counter()
+  for worker in workers: worker.start()
+  for worker in workers: worker.join()
+  done.wait()
+  print(messages / (time.perf_counter() - start))
+
+def run(backend, messages, threads):
+  with tempfile.TemporaryDirectory() as root:
+    with open(os.path.join(root, "storage-queues.json"), "w") as fp:
+      json.dump({ "container" : "queue" }, fp)
+    env = dict(os.environ,
+      AZURE_SA         = os.path.join(root, "sa"),
+      AZURE_SB_BACKEND = backend,
+      LOG_LEVEL        = "ERROR"
+    )
+    result = subprocess.run(
+      [ sys.executable, os.path.abspath(__file__), "child", str(messages), str(threads) ],
+      cwd=root, env=env, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().split("\n")[-1])
+
+if __name__ == "__main__":
+  if sys.argv[1:2] == [ "child" ]:
+    child(int(sys.argv[2]), int(sys.argv[3]))
+  else:
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    threads  = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    print(f"{messages} blob events, raised from {threads} threads")
+    for backend in [ "memory", "sqlite" ]:
+      print(f"  {backend:6} : {run(backend, messages, threads):10.0f} msg/s")
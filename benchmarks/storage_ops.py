@@ -0,0 +1,29 @@
+# operations per second of the basic storage account operations on small blobs
+#
+#   % python benchmarks/storage_ops.py [operations]
+
+import os
+import sys
+import time
+import tempfile
+
+# import azure from this checkout, wherever this is run from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+operations = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+def measure(name, f):
+  start = time.perf_counter()
+  for n in range(operations):
+    f(n)
+  print(f"  {name:7} : {operations / (time.perf_counter() - start):10.0f} ops/s")
+
+with tempfile.TemporaryDirectory() as root:
+  os.environ["AZURE_SA"] = root
+  from azure.storage.blob import StorageAccount
+
+  data = b"x" * 1024
+  print(f"{operations} operations on 1KB blobs")
+  measure("add",    lambda n: StorageAccount.add("bench", f"blob-{n % 1000}", data))
+  measure("exists", lambda n: StorageAccount.exists("bench", f"blob-{n % 1000}"))
+  measure("get",    lambda n: StorageAccount.get("bench", f"blob-{n % 1000}").readall())
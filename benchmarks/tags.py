@@ -0,0 +1,45 @@
+# cost of a tag update as the number of tagged blobs grows, comparing the
+# write-behind journal to rewriting all tags as one JSON document
+#
+#   % python benchmarks/tags.py [tags] [updates]
+
+import os
+import sys
+import json
+import time
+import tempfile
+
+# import azure from this checkout, wherever this is run from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+tags    = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+updates = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+with tempfile.TemporaryDirectory() as root:
+  os.environ["AZURE_SA"] = root
+  from azure.storage.blob import StorageAccount
+
+  for n in range(tags):
+    StorageAccount.tag("todo", f"blob-{n}.txt", { "tts" : 1666000000 + n })
+  StorageAccount.journal.flush()
+
+  start = time.perf_counter()
+  for n in range(updates):
+    StorageAccount.tag("todo", f"blob-{n}.txt", { "tts" : 1766000000 + n, "retries" : 1 })
+  journal = (time.perf_counter() - start) / updates
+  StorageAccount.journal.flush()
+
+  start = time.perf_counter()
+  with open(os.path.join(root, "tags.json"), "w") as fp:
+    json.dump(StorageAccount.tags, fp, indent=2)
+  rewrite = time.perf_counter() - start
+
+  StorageAccount.journal.compact()
+  start = time.perf_counter()
+  StorageAccount.journal.replay(StorageAccount.journal.snapshot, {})
+  load = time.perf_counter() - start
+
+print(f"{tags} tagged blobs, {updates} updates")
+print(f"  journal : {journal * 1e6:10.1f} us/update")
+print(f"  rewrite : {rewrite * 1e6:10.1f} us/update")
+print(f"  snapshot load : {load:.2f}s")